@@ -1,45 +1,262 @@
 # ai_ml.py
 import os
-import pandas as pd
-import numpy as np
-from joblib import load
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+# numpy and pandas are imported where they are used: the app imports this
+# module at startup but most workers never predict anything
 
 MODEL_PATH = os.path.join("models","capacity_model.joblib")
+# every prediction the model can make, written by train_capacity.py
+TABLE_PATH = os.path.join("models","capacity_table.npz")
 _model_data = None
+_model_stat = None
+_table = None
+_table_stat = None
+_versions = {}
+
+# Prediction cache: entries kept, and seconds before one goes stale (0 = never)
+CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 10000))
+CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", 0))
+
+def file_stat(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def file_version(path):
+    """Short content hash, recomputed only when the file changes."""
+    stat = file_stat(path)
+    cached = _versions.get(path)
+    if cached is None or cached[0] != stat:
+        with open(path, "rb") as f:
+            cached = _versions[path] = (stat, hashlib.sha256(f.read()).hexdigest()[:16])
+    return cached[1]
+
+def model_version():
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError("Capacity model not found. Run train_capacity.py first.")
+    return file_version(MODEL_PATH)
 
 def load_model():
-    global _model_data
-    if _model_data is None:
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError("Capacity model not found. Run train_capacity.py first.")
-        _model_data = load(MODEL_PATH)
+    """
+    Load the model once, and again whenever train_capacity.py rewrites the
+    file. md["version"] is a hash of the file contents.
+    """
+    global _model_data, _model_stat
+    version = model_version()
+    stat = file_stat(MODEL_PATH)
+    if _model_data is None or stat != _model_stat:
+        from joblib import load   # unpickling the forest imports sklearn
+
+        md = load(MODEL_PATH)
+        # feature column -> position in the model's input matrix
+        md["index"] = {c: i for i, c in enumerate(md["columns"])}
+        md["version"] = version
+        _model_data, _model_stat = md, stat
     return _model_data
 
-def predict_capacity_ml(origin, destination, date_str=None, cargo_type="General"):
-    # load model and columns
-    md = load_model()
-    model = md["model"]
-    columns = md["columns"]
+def load_table(version):
+    """
+    The precomputed table for this model version, or None when there is
+    none or it was built from a different model file.
+    """
+    global _table, _table_stat
+    if not os.path.exists(TABLE_PATH):
+        return None
+    stat = file_stat(TABLE_PATH)
+    if _table is None or stat != _table_stat:
+        import numpy as np
+
+        with np.load(TABLE_PATH, allow_pickle=False) as data:
+            _table = {
+                "predictions": data["predictions"],
+                "routes": {r: i for i, r in enumerate(data["routes"].tolist())},
+                "cargo_types": {c: i for i, c in enumerate(data["cargo_types"].tolist())},
+                "version": str(data["model_version"]),
+            }
+        _table_stat = stat
+    return _table if _table["version"] == version else None
+
+class PredictionCache:
+    """Thread-safe LRU of prediction results with an optional TTL."""
 
-    # extract month from date if provided
-    month = 1
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()   # key -> (stored_at, value)
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = self.expired = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+prediction_cache = PredictionCache()
+
+def month_of(date_str):
+    """Month from a YYYY-MM-DD date, 1 when missing or unparsable."""
     if date_str:
         try:
-            month = int(date_str.split("-")[1])
+            return int(date_str.split("-")[1])
         except Exception:
-            month = 1
-
-    route = f"{origin.upper()}-{destination.upper()}"
-    # build dataframe with same columns
-    row = {"month": month}
-    for c in columns:
-        if c.startswith("route_"):
-            row[c] = 1 if c == f"route_{route}" else 0
-        elif c.startswith("cargo_"):
-            row[c] = 1 if c == f"cargo_{cargo_type}" else 0
-        else:
-            if c not in row:
-                row[c] = 0
-    X = pd.DataFrame([row], columns=columns).fillna(0)
-    pred = int(model.predict(X)[0])
-    return {"predicted_capacity": pred, "route": f"{origin.upper()}->{destination.upper()}", "month":month}
+            pass
+    return 1
+
+def feature_matrix(queries, md):
+    """
+    One-hot feature matrix for (origin, destination, date, cargo_type)
+    tuples, built with a single scatter per feature group. Routes or cargo
+    types the model never saw leave their row all zeros, like the
+    per-column loop did.
+    """
+    import numpy as np
+    import pandas as pd
+
+    columns, index = md["columns"], md["index"]
+    X = np.zeros((len(queries), len(columns)))
+    rows = np.arange(len(queries))
+
+    if "month" in index:
+        X[:, index["month"]] = [month_of(q[2]) for q in queries]
+
+    for keys in (
+        [f"route_{q[0].upper()}-{q[1].upper()}" for q in queries],
+        [f"cargo_{q[3]}" for q in queries],
+    ):
+        cols = np.fromiter((index.get(k, -1) for k in keys), dtype=np.intp, count=len(keys))
+        hit = cols >= 0
+        X[rows[hit], cols[hit]] = 1
+
+    return pd.DataFrame(X, columns=columns)
+
+def prediction_table(model, columns):
+    """
+    Predict every input the model can see: months 1-12 x each known route
+    plus one unknown slot x each known cargo type plus one unknown slot.
+    predictions[month - 1, route, cargo_type]; index -1 is the unknown slot.
+    """
+    import numpy as np
+
+    routes = [c[len("route_"):] for c in columns if c.startswith("route_")]
+    cargo_types = [c[len("cargo_"):] for c in columns if c.startswith("cargo_")]
+    md = {"columns": columns, "index": {c: i for i, c in enumerate(columns)}}
+
+    # "?" never matches a route or cargo column, so it encodes the unknown slot
+    queries = [
+        tuple(route.split("-", 1)) + (f"2000-{month:02d}-01", cargo_type)
+        for month in range(1, 13)
+        for route in routes + ["?-?"]
+        for cargo_type in cargo_types + ["?"]
+    ]
+    predictions = model.predict(feature_matrix(queries, md)).astype(np.int64)
+    return {
+        "predictions": predictions.reshape(12, len(routes) + 1, len(cargo_types) + 1),
+        "routes": np.array(routes),
+        "cargo_types": np.array(cargo_types),
+    }
+
+def predict_capacity_ml_batch(queries):
+    """
+    Predict capacity for many (origin, destination, date, cargo_type)
+    tuples. Known months are answered from the precomputed table; anything
+    else is looked up in the cache and the rest go through one
+    model.predict call. Results are in input order and match
+    predict_capacity_ml row for row.
+    """
+    queries = [
+        (origin, destination, date_str, cargo_type or "General")
+        for origin, destination, date_str, cargo_type in queries
+    ]
+    if not queries:
+        return []
+
+    version = model_version()
+    # the model only sees route, month and cargo type; the file hash makes
+    # a retrained model miss every old cache entry
+    keys = [
+        (version, f"{o.upper()}-{d.upper()}", month_of(date_str), cargo_type)
+        for o, d, date_str, cargo_type in queries
+    ]
+    preds = [None] * len(keys)
+
+    table = load_table(version)
+    if table is not None:
+        predictions, routes, cargo_types = (
+            table["predictions"], table["routes"], table["cargo_types"]
+        )
+        for i, (_, route, month, cargo_type) in enumerate(keys):
+            if 1 <= month <= 12:
+                preds[i] = int(predictions[
+                    month - 1, routes.get(route, -1), cargo_types.get(cargo_type, -1)
+                ])
+
+    # whatever the table cannot answer goes through the cache and the model
+    todo = {}
+    for i, key in enumerate(keys):
+        if preds[i] is None:
+            pred = prediction_cache.get(key)
+            if pred is None:
+                todo.setdefault(key, []).append(i)
+            else:
+                preds[i] = pred
+    if todo:
+        md = load_model()
+        first = [positions[0] for positions in todo.values()]
+        fresh = md["model"].predict(feature_matrix([queries[i] for i in first], md))
+        for (key, positions), pred in zip(todo.items(), fresh):
+            pred = int(pred)
+            prediction_cache.put(key, pred)
+            for i in positions:
+                preds[i] = pred
+
+    return [
+        {
+            "predicted_capacity": pred,
+            "route": f"{origin.upper()}->{destination.upper()}",
+            "month": month_of(date_str),
+        }
+        for (origin, destination, date_str, _), pred in zip(queries, preds)
+    ]
+
+def predict_capacity_ml(origin, destination, date_str=None, cargo_type="General"):
+    return predict_capacity_ml_batch([(origin, destination, date_str, cargo_type)])[0]
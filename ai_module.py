@@ -1,35 +1,123 @@
 # ai_module.py
 # Offline LLM Assistant Module for Cargo Platform (Using Ollama)
+#
+# Prompts go to a long-running Ollama (or Ollama-compatible) server over
+# HTTP, so the model stays loaded between calls. OLLAMA_URL points at it;
+# `python llm_stub.py` stands in for it during development and benchmarks.
 
-import subprocess
+import os
 import json
 import re
+import time
+import threading
+
+import llm_cache
+import llm_slots
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
+DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama3")
+
+CONNECT_TIMEOUT = 3.05
+TOKEN_TIMEOUT = float(os.environ.get("OLLAMA_TOKEN_TIMEOUT", 60))      # gap between tokens
+GENERATE_TIMEOUT = float(os.environ.get("OLLAMA_GENERATE_TIMEOUT", 300))  # whole answer
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared keep-alive session; only connection failures are retried."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=POOL_SIZE)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
 
 
 # ---------------------------------------------------------
 # RUN OFFLINE MODEL (LLaMA / Mistral / Phi3 etc.)
 # ---------------------------------------------------------
-def ask_ai(prompt, model="llama3"):
+def stream_ai(prompt, model=DEFAULT_MODEL):
+    """
+    Yield the answer token by token as the model produces them, holding an
+    llm_slots slot until the answer ends. Raises llm_slots.Busy when no slot
+    frees up, and TimeoutError if the whole answer takes longer than
+    GENERATE_TIMEOUT.
+    Tokens are raw model output; run the joined text through clean_output.
+    """
+    with llm_slots.slot():   # shared with llm_queue and llm_integration
+        deadline = time.monotonic() + GENERATE_TIMEOUT
+        with get_session().post(
+            f"{OLLAMA_URL}/api/generate",
+            json={"model": model, "prompt": prompt, "stream": True},
+            stream=True,
+            timeout=(CONNECT_TIMEOUT, TOKEN_TIMEOUT),
+        ) as resp:
+            resp.raise_for_status()
+            # one JSON object per line: {"response": "<token>", "done": false}.
+            # Read to the end even after "done" so the connection goes back to
+            # the pool instead of being closed.
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"no complete answer after {GENERATE_TIMEOUT:.0f}s")
+
+
+def generate(prompt, model=DEFAULT_MODEL):
+    """The cleaned full answer, from llm_cache when this prompt was seen before."""
+    return llm_cache.cache.cached(
+        f"ollama:{model}", prompt, lambda: clean_output("".join(stream_ai(prompt, model)))
+    )
+
+
+def stream_cached(prompt, model=DEFAULT_MODEL):
+    """stream_ai through llm_cache: a cached answer arrives as one token."""
+    cached = llm_cache.cache.get(f"ollama:{model}", prompt)
+    if cached is not None:
+        yield cached
+        return
+    tokens = []
+    for token in stream_ai(prompt, model):
+        tokens.append(token)
+        yield token
+    llm_cache.cache.put(f"ollama:{model}", prompt, clean_output("".join(tokens)))
+
+
+def ask_ai(prompt, model=DEFAULT_MODEL):
     """
-    Sends a prompt to the local Ollama LLM model.
+    Sends a prompt to the local Ollama LLM model and returns the whole answer.
     Example model names: llama3, mistral, phi3, gemma.
     """
 
     try:
-        result = subprocess.run(
-            ["ollama", "run", model],
-            input=prompt.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-
-        answer = result.stdout.decode("utf-8")
-        return clean_output(answer)
+        return generate(prompt, model)
 
+    except llm_slots.Busy:
+        raise
     except Exception as e:
         return f"AI engine error: {e}"
 
 
+def answer(prompt, stream=False):
+    """The full answer, or a token generator when stream is set."""
+    return stream_cached(prompt) if stream else ask_ai(prompt)
+
+
 # ---------------------------------------------------------
 # CLEAN LLM OUTPUT (REMOVE TOKENS, JSON MARKERS, ETC.)
 # ---------------------------------------------------------
@@ -46,7 +134,7 @@ def clean_output(text):
 # ---------------------------------------------------------
 # SMART ROUTE ANALYZER
 # ---------------------------------------------------------
-def analyze_route(flight1, flight2):
+def analyze_route(flight1, flight2, stream=False):
     """
     Takes 2 legs and returns an AI explanation.
     """
@@ -80,14 +168,14 @@ Leg 2:
 
 Give the explanation in 5 bullet points.
 """
-    return ask_ai(prompt)
+    return answer(prompt, stream)
 
 
 
 # ---------------------------------------------------------
 # CARGO RISK ANALYZER
 # ---------------------------------------------------------
-def cargo_risk(cargo_type):
+def cargo_risk(cargo_type, stream=False):
     """
     AI predicts risks for a given type of cargo.
     """
@@ -103,14 +191,14 @@ Cargo Type: {cargo_type}
 Give the answer in bullet points.
 """
 
-    return ask_ai(prompt)
+    return answer(prompt, stream)
 
 
 
 # ---------------------------------------------------------
 # CAPACITY PREDICTION (AI-BASED)
 # ---------------------------------------------------------
-def predict_capacity(airline, origin, destination):
+def predict_capacity(airline, origin, destination, stream=False):
     """
     AI predicts expected cargo capacity based on patterns.
     No real ML model needed — LLM reasoning.
@@ -131,14 +219,14 @@ Consider:
 Give capacity range in kg + short explanation.
 """
 
-    return ask_ai(prompt)
+    return answer(prompt, stream)
 
 
 
 # ---------------------------------------------------------
 # CHATBOT FOR USER PORTAL
 # ---------------------------------------------------------
-def chat_with_ai(message):
+def chat_with_ai(message, stream=False):
     """
     General assistant for your platform.
     """
@@ -152,4 +240,4 @@ User asked:
 Give a helpful and concise reply.
 """
 
-    return ask_ai(prompt)
+    return answer(prompt, stream)
@@ -0,0 +1,272 @@
+# airports.py
+# In-memory airport and route index for the chat assistant. Airports come
+# from the bundled IATA dataset (data/airports.csv) plus every code in the
+# flights table; routes keep a flight count, total capacity and the best
+# flights, so a route question is answered without touching the database.
+# The same dataset places the arcs of the /api/all_routes route map.
+
+import os
+import re
+import csv
+import json
+import time
+import heapq
+import hashlib
+import threading
+
+import database
+import utilization
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "airports.csv")
+
+MAX_LISTED = 10        # flights listed per route
+CHECK_INTERVAL = 10    # seconds between checks for flight/booking changes
+
+WORD = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+
+ROUTE_ROWS_SQL = """
+    SELECT origin, destination, id, airline, flight_no, date, capacity
+    FROM flights
+    WHERE origin IS NOT NULL AND destination IS NOT NULL
+"""
+
+
+# --------------------------
+# BUNDLED DATASET
+# --------------------------
+_dataset = None
+_dataset_lock = threading.Lock()
+
+
+def load_airports():
+    """{IATA code: row} from data/airports.csv, read once per process."""
+    global _dataset
+    with _dataset_lock:
+        if _dataset is None:
+            with open(DATASET_PATH, newline="", encoding="utf-8") as f:
+                _dataset = {
+                    row["iata"]: dict(row, latitude=float(row["latitude"]),
+                                      longitude=float(row["longitude"]))
+                    for row in csv.DictReader(f)
+                }
+        return _dataset
+
+
+# --------------------------
+# INDEX
+# --------------------------
+def summarize_routes(rows):
+    """
+    {(origin, destination): {"flights", "capacity", "best"}} in one pass;
+    "best" is the MAX_LISTED largest-capacity flights as
+    (airline, flight_no, date, capacity).
+    """
+    routes = {}
+    for origin, destination, flight_id, airline, flight_no, date, capacity in rows:
+        route = routes.get((origin, destination))
+        if route is None:
+            route = routes[(origin, destination)] = {"flights": 0, "capacity": 0, "best": []}
+        capacity = capacity or 0
+        route["flights"] += 1
+        route["capacity"] += capacity
+        # min-heap of the largest capacities; lower id wins ties
+        item = (capacity, -flight_id, airline, flight_no, date)
+        if len(route["best"]) < MAX_LISTED:
+            heapq.heappush(route["best"], item)
+        elif item > route["best"][0]:
+            heapq.heapreplace(route["best"], item)
+
+    for route in routes.values():
+        route["best"] = [
+            (airline, flight_no, date, capacity)
+            for capacity, _, airline, flight_no, date in sorted(route["best"], reverse=True)
+        ]
+    return routes
+
+
+class AirportIndex:
+    """
+    Airport codes, a word trie over city and airport names, and a summary
+    per origin→destination pair.
+    """
+
+    def __init__(self, airports, routes):
+        self.airports = airports
+        self.routes = routes
+
+        # codes with at least one flight win over bundled-only ones
+        self.served = {code for route in self.routes for code in route}
+        self.codes = self.served | airports.keys()
+
+        self.trie = {}
+        for code, info in sorted(airports.items(), key=lambda a: a[0] not in self.served):
+            for phrase in (info["city"], info["name"]):
+                node = self.trie
+                for word in WORD.findall(phrase.lower()):
+                    node = node.setdefault(word, {})
+                node.setdefault(None, code)
+
+    def _match_name(self, words, i):
+        """Longest city/airport name starting at words[i]: (code, length)."""
+        node, found = self.trie, (None, 0)
+        for j in range(i, len(words)):
+            node = node.get(words[j].lower())
+            if node is None:
+                break
+            if None in node:
+                found = (node[None], j - i + 1)
+        return found
+
+    def resolve(self, message):
+        """
+        Airport codes mentioned in the message, in order: codes typed in
+        capitals ("FRA"), lower-case codes of airports we fly ("fra"), and
+        city or airport names ("Frankfurt", "New York").
+        """
+        words = WORD.findall(message)
+        codes, i = [], 0
+        while i < len(words):
+            code, length = self._match_name(words, i)
+            if code is None:
+                word = words[i]
+                if len(word) == 3 and (
+                    (word.isupper() and word in self.codes) or word.upper() in self.served
+                ):
+                    code = word.upper()
+                length = 1
+            if code and (not codes or codes[-1] != code):
+                codes.append(code)
+            i += length
+        return codes
+
+    def route(self, origin, destination):
+        return self.routes.get((origin, destination))
+
+
+# --------------------------
+# SHARED INDEX
+# --------------------------
+_index = None
+_index_key = None
+_checked_at = 0.0
+_refreshing = False
+_lock = threading.Lock()
+
+
+def build(db):
+    return AirportIndex(load_airports(), summarize_routes(db.execute(ROUTE_ROWS_SQL)))
+
+
+def get_index(db):
+    """
+    Process-wide index, checked against utilization.flights_key() at most
+    every CHECK_INTERVAL seconds. Only the first build blocks: after a change
+    the old index keeps answering while a new one is built in the background.
+    Bookings do not trigger a rebuild, so route capacities in the index are
+    as of the last flight change.
+    """
+    global _index, _index_key, _checked_at, _refreshing
+    with _lock:
+        now = time.monotonic()
+        if _index is not None and (_refreshing or now - _checked_at < CHECK_INTERVAL):
+            return _index
+        _checked_at = now
+        key = utilization.flights_key(db)
+        if _index is None:
+            _index, _index_key = build(db), key
+        elif key != _index_key:
+            _refreshing = True
+            threading.Thread(target=_refresh, args=(key,), name="airport-index", daemon=True).start()
+        return _index
+
+
+def _refresh(key):
+    global _index, _index_key, _refreshing
+    index = None
+    try:
+        db = database.connect()
+        try:
+            index = build(db)
+        finally:
+            db.close()
+    except Exception as e:   # sqlite3 or psycopg errors
+        print("airport index refresh failed:", e)
+    with _lock:
+        if index is not None:
+            _index, _index_key = index, key
+        _refreshing = False
+
+
+# --------------------------
+# ROUTE MAP (/api/all_routes)
+# --------------------------
+ROUTE_COUNTS_SQL = """
+    SELECT origin, destination, COUNT(*) FROM flights
+    WHERE origin IS NOT NULL AND destination IS NOT NULL
+    GROUP BY origin, destination
+"""
+
+# remaining capacity per route from the utilization summary; summing
+# flights.capacity would read every flight row instead of the index
+ROUTE_CAPACITY_SQL = """
+    SELECT origin, destination, SUM(capacity) FROM route_utilization
+    GROUP BY origin, destination
+"""
+
+
+def route_arcs(db):
+    """One arc per route whose airports are in the dataset, busiest first."""
+    coords = load_airports()
+    capacity = {(o, d): total for o, d, total in db.execute(ROUTE_CAPACITY_SQL)}
+    arcs = []
+    for origin, destination, flights in db.execute(ROUTE_COUNTS_SQL):
+        start, end = coords.get(origin), coords.get(destination)
+        if start is None or end is None:
+            continue
+        arcs.append({
+            "origin": origin,
+            "destination": destination,
+            "startLat": start["latitude"],
+            "startLng": start["longitude"],
+            "endLat": end["latitude"],
+            "endLng": end["longitude"],
+            "flights": flights,
+            "capacity": capacity.get((origin, destination)) or 0,
+        })
+    arcs.sort(key=lambda a: (-a["flights"], a["origin"], a["destination"]))
+    return arcs
+
+
+_route_map = None        # (data key, JSON body, ETag)
+_route_map_checked = 0.0
+_route_map_lock = threading.Lock()
+
+
+def route_map(db):
+    """
+    (JSON body, ETag) of the route map, checked at most every CHECK_INTERVAL
+    seconds and only rebuilt when utilization.data_key() changed. Unlike the
+    index it follows bookings too, because the map shows remaining capacity.
+    """
+    global _route_map, _route_map_checked
+    with _route_map_lock:
+        now = time.monotonic()
+        if _route_map is not None and now - _route_map_checked < CHECK_INTERVAL:
+            return _route_map[1:]
+        _route_map_checked = now
+        key = utilization.data_key(db)
+        if _route_map is None or _route_map[0] != key:
+            body = json.dumps(route_arcs(db), separators=(",", ":"))
+            _route_map = (key, body, hashlib.sha256(body.encode("utf-8")).hexdigest())
+        return _route_map[1:]
+
+
+def invalidate():
+    """Check for changes (and rebuild) on the next lookup."""
+    global _index_key, _checked_at, _route_map
+    with _lock:
+        _index_key = None
+        _checked_at = 0.0
+    with _route_map_lock:
+        # flight upserts can change capacity without changing the data key
+        _route_map = None
@@ -1,35 +1,20 @@
 from flask import Flask, render_template, request, redirect, session, jsonify
-from database import get_db, init_db
+from database import close_db, init_db
+import storage
+from storage import get_repo
+import routing
+import airports
+import ingest
+import utilization
+import hold_expiry
+import pubsub
 from werkzeug.security import generate_password_hash, check_password_hash
-from ai_ml import predict_capacity_ml, load_model
-from llm_integration import ask_llm
+from ai_ml import predict_capacity_ml, predict_capacity_ml_batch, prediction_cache, model_version
+import llm_integration
+import llm_queue
+import llm_cache
+import llm_slots
 from flask import send_from_directory
-import csv
-import xml.etree.ElementTree as ET
-import pandas as pd
-from PyPDF2 import PdfReader
-#something to ckeck and also something to check
-def insert_flight(db, row):
-    if not isinstance(row, dict):
-        row = row.to_dict()
-
-    airline = row.get("airline", "").strip()
-    flight_no = row.get("flight_no", "").strip()
-    origin = row.get("origin", "").upper().strip()
-    destination = row.get("destination", "").upper().strip()
-    capacity = int(row.get("capacity", 0))
-    cargo_type = row.get("cargo_type", "General").strip()
-
-    date = str(row.get("date", "")).strip().replace("/", "-")
-
-    parts = date.split("-")
-    if len(parts) == 3 and len(parts[0]) == 2:
-        date = f"{parts[2]}-{parts[1]}-{parts[0]}"
-
-    db.execute("""
-        INSERT INTO flights (airline, flight_no, origin, destination, date, capacity, cargo_type)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (airline, flight_no, origin, destination, date, capacity, cargo_type))
 
 RATE_CARD = {
     "General": 12,            # ₹12 per kg
@@ -42,10 +27,19 @@ RATE_CARD = {
 
 app = Flask(__name__)
 app.secret_key = "secret123"
+app.teardown_appcontext(close_db)
 
 #init_db()
 
 
+@app.before_request
+def start_background_workers():
+    # once per process; releases expired booking holds
+    hold_expiry.get_worker()
+    if os.environ.get("CARGO_PRELOAD"):
+        llm_integration.warm_up()
+
+
 # --------------------------
 # AUTH HELPERS
 # --------------------------
@@ -75,14 +69,9 @@ def register():
         password = generate_password_hash(request.form["password"])
         role = request.form["role"]
 
-        db = get_db()
-        try:
-            db.execute("INSERT INTO users(username,password,role) VALUES(?,?,?)",
-                       (username, password, role))
-            db.commit()
+        if get_repo().create_user(username, password, role):
             return redirect("/login")
-        except:
-            return "User already exists"
+        return "User already exists"
 
     return render_template("register.html")
 
@@ -91,39 +80,20 @@ def airline_optimizer():
     if current_role() != "airline":
         return "Unauthorized"
 
-    db = get_db()
-
-    flights = db.execute("SELECT * FROM flights").fetchall()
-    bookings = db.execute(
-        "SELECT * FROM bookings WHERE status='CONFIRMED'"
-    ).fetchall()
+    # -------- ROUTE STATS (from the route_utilization summary) --------
+    rows = utilization.route_totals(get_repo().db)
+    route_stats = {
+        f"{r['origin']} → {r['destination']}": {
+            "capacity": r["capacity"],
+            "used": r["used"]
+        }
+        for r in rows
+    }
 
-    total_capacity = sum(f["capacity"] for f in flights)
-    total_used = sum(b["weight"] for b in bookings)
+    total_capacity = sum(r["capacity"] for r in rows)
+    total_used = sum(r["used"] for r in rows)
     unused_capacity = total_capacity - total_used
 
-    # -------- ROUTE STATS (THIS WAS MISSING) --------
-    route_stats = {}
-
-    for f in flights:
-        route = f"{f['origin']} → {f['destination']}"
-        if route not in route_stats:
-            route_stats[route] = {
-                "capacity": 0,
-                "used": 0
-            }
-        route_stats[route]["capacity"] += f["capacity"]
-
-    for b in bookings:
-        flight = db.execute(
-            "SELECT * FROM flights WHERE id=?",
-            (b["flight_id"],)
-        ).fetchone()
-
-        if flight:
-            route = f"{flight['origin']} → {flight['destination']}"
-            route_stats[route]["used"] += b["weight"]
-
     # -------- RECOMMENDATIONS --------
     recommendations = []
 
@@ -134,14 +104,14 @@ def airline_optimizer():
         if cap == 0:
             continue
 
-        utilization = used / cap
+        ratio = used / cap
 
-        if utilization < 0.5:
+        if ratio < 0.5:
             recommendations.append({
                 "route": route,
                 "message": "⚠ Low utilization – consider discounts or interline partnerships"
             })
-        elif utilization > 0.9:
+        elif ratio > 0.9:
             recommendations.append({
                 "route": route,
                 "message": "🔥 High demand – increase price or add frequency"
@@ -149,8 +119,6 @@ def airline_optimizer():
 
     return render_template(
         "airline_optimizer.html",
-        flights=flights,
-        bookings=bookings,
         total_capacity=total_capacity,
         total_used=total_used,
         unused_capacity=unused_capacity,
@@ -167,8 +135,7 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
 
-        db = get_db()
-        user = db.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
+        user = get_repo().user_by_username(username)
 
         if user and check_password_hash(user["password"], password):
             session["user_id"] = user["id"]
@@ -197,16 +164,7 @@ def upload():
         return "Unauthorized"
 
     if request.method == "POST":
-        db = get_db()
-
-        db.execute("""
-            INSERT INTO flights (
-                airline, flight_no, origin, destination,
-                date, capacity, cargo_type,
-                departure_time, arrival_time, duration_minutes
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        get_repo().upsert_flights([(
             request.form["airline"],
             request.form["flight_no"],
             request.form["origin"].upper(),
@@ -217,17 +175,16 @@ def upload():
             request.form["departure_time"],
             request.form["arrival_time"],
             int(request.form["duration_minutes"])
-        ))
-
-        db.commit()
+        )])
+        routing.invalidate()
+        airports.invalidate()
         return render_template("upload.html", message="✅ Flight uploaded with timings!")
 
     return render_template("upload.html")
 
 
 
-import csv, json, os
-import pandas as pd  # for Excel
+import json, os
 from werkzeug.utils import secure_filename
 
 UPLOAD_FOLDER = "uploads"
@@ -251,37 +208,70 @@ def upload_csv():
             return render_template("upload_csv.html", message="No file selected!")
 
         filename = secure_filename(file.filename)
-        if not filename.endswith(".csv"):
-            return render_template("upload_csv.html", message="Only CSV files are allowed!")
+        if not filename.lower().endswith(ingest.SUPPORTED_EXTENSIONS):
+            return render_template("upload_csv.html", message="Only CSV, Excel (.xlsx) or XML files are allowed!")
 
         filepath = os.path.join("uploads", filename)
         file.save(filepath)
 
-        db = get_db()
-
         try:
-            with open(filepath, "r") as f:
-                reader = csv.DictReader(f)
-
-                for row in reader:
-                    insert_flight(db, row)
-
-            db.commit()
-            message = "CSV flights uploaded successfully!"
+            stats = ingest.load_file(get_repo().db, filepath)
+            routing.invalidate()
+            airports.invalidate()
+            message = (f"{stats['rows']} flights uploaded successfully "
+                       f"in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec)!")
 
         except Exception as e:
-            message = f"Error uploading CSV: {str(e)}"
+            message = f"Error uploading file: {str(e)}"
 
     return render_template("upload_csv.html", message=message)
 
-def parse_csv(filepath, db):
-    with open(filepath, "r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            insert_flight(db, row)
 
+# --------------------------
+# INTERLINE ROUTING
+# --------------------------
+def load_legs(repo, id_lists):
+    """Flights rows for each list of leg ids, fetched in one query."""
+    flights = repo.flights_by_id({fid for legs in id_lists for fid in legs})
+    return [[flights[fid] for fid in legs] for legs in id_lists]
+
+
+MAX_INTERLINE_RESULTS = 100
 
 
+def interline_limit():
+    """Connections to list: the "results" field sent by "Show more", capped."""
+    k = request.form.get("results", routing.MAX_RESULTS, type=int)
+    return max(1, min(k, MAX_INTERLINE_RESULTS))
+
+
+def more_interline(routes, k, origin, destination, date):
+    """Form values for the next "Show more" request, or None when all are shown."""
+    if len(routes) < k or k >= MAX_INTERLINE_RESULTS:
+        return None
+    return {"origin": origin, "destination": destination, "date": date,
+            "shown": len(routes), "results": k + routing.MAX_RESULTS}
+
+
+def interline_routes(repo, origin, destination, date, **options):
+    """
+    Connecting itineraries (two or more legs) from the routing graph,
+    with each leg as a fresh flights row.
+    """
+    graph = routing.get_graph(repo.db)
+    itineraries = graph.search(origin, destination, date, min_legs=2, **options)
+    all_legs = load_legs(repo, [it["flight_ids"] for it in itineraries])
+
+    routes = []
+    for it, legs in zip(itineraries, all_legs):
+        routes.append({
+            "legs": legs,
+            "capacity": min(f["capacity"] for f in legs),
+            "cargo_type": legs[0]["cargo_type"],
+            "transit": it["transit_minutes"] / 60,
+            "timed": it["timed"]
+        })
+    return routes
 
 
 # SEARCH (AIRLINE view)
@@ -295,93 +285,44 @@ def search():
     interline = []
 
     if request.method == "POST":
-        db = get_db()
+        repo = get_repo()
         origin = request.form["origin"]
         dest = request.form["destination"]
         date = request.form["date"]
         cargo_type = request.form["cargo_type"]
 
-        query = """
-            SELECT * FROM flights 
-            WHERE origin=? AND destination=? AND date=?
-        """
-        params = [origin, dest, date]
-
-        if cargo_type:
-            query += " AND cargo_type=?"
-            params.append(cargo_type)
-
-        results = db.execute(query, params).fetchall()
-
-        first_legs = db.execute(
-            "SELECT * FROM flights WHERE origin=? AND date=?",
-            (origin, date)
-        ).fetchall()
-
-        second_legs = db.execute(
-            "SELECT * FROM flights WHERE destination=? AND date=?",
-            (dest, date)
-        ).fetchall()
-
-        for f1 in first_legs:
-            for f2 in second_legs:
-                if f1["destination"] == f2["origin"]:
-
-                    if f1["cargo_type"] != f2["cargo_type"]:
-                        continue
-
-                    interline.append({
-                        "legs": [f1, f2],
-                        "capacity": min(f1["capacity"], f2["capacity"]),
-                        "cargo_type": f1["cargo_type"]
-                    })
+        results = repo.find_flights(origin, dest, date, cargo_type)
 
-    # remove duplicate interline routes
-    unique = []
-    seen = set()
+        # same-date, same-cargo-type connections, already deduplicated
+        matches = routing.two_leg_routes(repo.db, origin, dest, date, same_cargo_type=True)
+        all_legs = load_legs(repo, [(m["leg1_id"], m["leg2_id"]) for m in matches])
 
-    for r in interline:
-        key = (r["legs"][0]["origin"], r["legs"][0]["destination"], r["legs"][1]["destination"], r["capacity"])
-        if key not in seen:
-            unique.append(r)
-            seen.add(key)
+        for m, legs in zip(matches, all_legs):
+            interline.append({
+                "legs": legs,
+                "capacity": m["leg_capacity"],
+                "cargo_type": m["cargo_type"]
+            })
 
-    return render_template("search.html", results=results, interline=unique)
+    return render_template("search.html", results=results, interline=interline)
 
 
 @app.route("/interline", methods=["GET", "POST"])
 def interline():
-    db = get_db()
     routes = []
+    more = None
 
     if request.method == "POST":
         origin = request.form["origin"].upper()
         destination = request.form["destination"].upper()
         date = request.form["date"]
 
+        # earliest arrivals first, routing.MAX_RESULTS more per "Show more"
+        k = interline_limit()
+        routes = interline_routes(get_repo(), origin, destination, date, k=k)
+        more = more_interline(routes, k, origin, destination, date)
 
-        # Get all possible first-leg flights
-        first_legs = db.execute(
-            "SELECT * FROM flights WHERE origin=? AND date=?",
-            (origin, date)
-        ).fetchall()
-
-        # Get all possible second-leg flights
-        second_legs = db.execute(
-            "SELECT * FROM flights WHERE destination=? AND date=?",
-            (destination, date)
-        ).fetchall()
-
-        # MATCH INTERLINE CONNECTIONS
-        for f1 in first_legs:
-            for f2 in second_legs:
-                if f1["destination"] == f2["origin"]:
-                    routes.append({
-                        "legs": [f1, f2],
-                        "capacity": min(f1["capacity"], f2["capacity"])
-                    })
-
-    return render_template("interline.html", routes=routes)
+    return render_template("interline.html", routes=routes, more=more)
 
 # --------------------------
 # FORWARDER SEARCH & BOOKING
@@ -391,7 +332,7 @@ def forwarder_search():
     if current_role() != "forwarder":
         return "Unauthorized"
 
-    db = get_db()
+    repo = get_repo()
     results = []
     interline = []
 
@@ -399,37 +340,24 @@ def forwarder_search():
     cheapest = None
     quickest = None
     best_value = None
+    more = None
 
     if request.method == "POST":
         origin = request.form["origin"].upper()
         dest = request.form["destination"].upper()
         date = request.form["date"]
 
-        results = db.execute(
-            "SELECT * FROM flights WHERE origin=? AND destination=? AND date=?",
-            (origin, dest, date)
-        ).fetchall()
+        results = repo.find_flights(origin, dest, date)
 
         # --- Interline logic ---
-        first_legs = db.execute(
-            "SELECT * FROM flights WHERE origin=? AND date=?",
-            (origin, date)
-        ).fetchall()
-
-        second_legs = db.execute(
-            "SELECT * FROM flights WHERE destination=? AND date=?",
-            (dest, date)
-        ).fetchall()
-
-        for f1 in first_legs:
-            for f2 in second_legs:
-                if f1["destination"] == f2["origin"]:
-                    interline.append({
-                        "legs": [f1, f2],
-                        "capacity": min(f1["capacity"], f2["capacity"]),
-                        "price": RATE_CARD.get(f1["cargo_type"], 15),
-                        "transit": 12 + 8   # fake transit hours for demo
-                    })
+        k = interline_limit()
+        routes = interline_routes(repo, origin, dest, date, k=k)
+        more = more_interline(routes, k, origin, dest, date)
+        for r in routes:
+            r["price"] = RATE_CARD.get(r["cargo_type"], 15)
+            if not r["timed"]:
+                r["transit"] = 12 + 8   # no schedule times, demo value
+            interline.append(r)
 
         # --- Build unified list for matrix ---
         all_options = []
@@ -459,7 +387,8 @@ def forwarder_search():
         interline=interline,
         cheapest=cheapest,
         quickest=quickest,
-        best_value=best_value
+        best_value=best_value,
+        more=more
     )
 
 # --------------------------
@@ -472,7 +401,7 @@ def book():
     if current_role() != "forwarder":
         return "Unauthorized"
 
-    db = get_db()
+    repo = get_repo()
     flight_id = request.form["flight_id"]
 
     actual_weight = float(request.form.get("actual_weight", 0))
@@ -481,7 +410,7 @@ def book():
     height = float(request.form.get("height", 0))
 
     # Fetch flight info
-    flight = db.execute("SELECT * FROM flights WHERE id=?", (flight_id,)).fetchone()
+    flight = repo.flight(flight_id)
     if not flight:
         return "Flight not found"
 
@@ -494,40 +423,48 @@ def book():
     rate = RATE_CARD.get(cargo_type, 15)
     total_price = rate * chargeable_weight
 
-    # Capacity check
-    if chargeable_weight > flight["capacity"]:
-        return "Not enough capacity"
-
-    new_capacity = flight["capacity"] - chargeable_weight
-    db.execute("UPDATE flights SET capacity=? WHERE id=?", (new_capacity, flight_id))
-
     import time
     expires_at = int(time.time()) + 120
 
-    # Insert booking
-    db.execute("""
-        INSERT INTO bookings(user_id, flight_id, actual_weight, volumetric_weight, 
-        chargeable_weight, weight, status, expires_at, price, total, payment_status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """,
-    (
+    # capacity is checked and taken in one statement; this also cancels
+    # any MODIFY_PENDING bookings by this user
+    booking_id = repo.create_hold(
         session["user_id"], flight_id,
         actual_weight, volumetric_weight, chargeable_weight,
-        chargeable_weight,  # weight column used internally
-        "HOLD", expires_at,
-        rate, total_price, "UNPAID"
-    ))
-    # Cancel any MODIFY_PENDING bookings by this user
-    db.execute("""
-        UPDATE bookings
-        SET status='CANCELLED'
-        WHERE user_id=? AND status='MODIFY_PENDING'
-    """, (session["user_id"],))
-
-    db.commit()
+        rate, total_price, expires_at
+    )
+    if booking_id is None:
+        return "Not enough capacity"
+
+    hold_expiry.schedule(booking_id, expires_at)
     return redirect("/bookings")
 
 
+# --------------------------
+# PAGINATION
+# --------------------------
+def page_args():
+    """?cursor=<id>&limit=<n> as (cursor or None, limit capped at MAX_PAGE_SIZE)."""
+    cursor = request.args.get("cursor", type=int)
+    limit = request.args.get("limit", storage.PAGE_SIZE, type=int)
+    return cursor, max(1, min(limit, storage.MAX_PAGE_SIZE))
+
+
+def page_response(rows, next_cursor):
+    """JSON page; pass "next" back as ?cursor= for the following page."""
+    return jsonify({"ok": True, "items": [dict(r) for r in rows], "next": next_cursor})
+
+
+def all_pages(fetch):
+    """Every row of a paged query, one page at a time; fetch(cursor) -> (rows, next)."""
+    cursor = None
+    while True:
+        rows, cursor = fetch(cursor)
+        yield from rows
+        if cursor is None:
+            return
+
+
 # --------------------------
 # VIEW BOOKINGS
 # --------------------------
@@ -536,58 +473,50 @@ def bookings_view():
     if not is_logged_in():
         return redirect("/login")
 
-    db = get_db()
-    import time
-    now = int(time.time())
-
-    # 1️⃣ Find expired HOLD bookings
-    expired = db.execute(
-        "SELECT * FROM bookings WHERE status='HOLD' AND expires_at < ?",
-        (now,)
-    ).fetchall()
+    # expired holds are released by the hold_expiry worker
+    repo = get_repo()
+    bookings, next_cursor = repo.bookings(repo.user(session["user_id"]), *page_args())
 
-    # 2️⃣ Auto-expire them + restore capacity
-    for b in expired:
-        flight = db.execute("SELECT * FROM flights WHERE id=?", (b["flight_id"],)).fetchone()
+    return render_template("booking_management.html", bookings=bookings, next_cursor=next_cursor)
 
-        # Restore capacity
-        restored = flight["capacity"] + b["weight"]
-        db.execute("UPDATE flights SET capacity=? WHERE id=?", (restored, b["flight_id"]))
 
-        # Change status to EXPIRED
-        db.execute("UPDATE bookings SET status='CANCELLED' WHERE id=?", (b["id"],))
-
-    db.commit()
-
-    bookings = db.execute("SELECT * FROM bookings").fetchall()
-
-    return render_template("booking_management.html", bookings=bookings)
+@app.route("/api/bookings")
+def api_bookings():
+    if not is_logged_in():
+        return jsonify({"ok": False, "error": "login required"}), 401
+    repo = get_repo()
+    return page_response(*repo.bookings(repo.user(session["user_id"]), *page_args()))
 
 
+def feed_response(flights):
+    """JSON feed with an ETag so feed_sync can skip unchanged feeds."""
+    resp = jsonify(flights)
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 
 @app.route("/api/emirates")
 def api_emirates():
-    return jsonify([
+    return feed_response([
         {"airline": "Emirates", "flight_no": "EK215", "origin": "DXB", "destination": "LAX", "date": "2025-12-10", "capacity": 9500, "cargo_type": "Pharma"},
         {"airline": "Emirates", "flight_no": "EK7", "origin": "DXB", "destination": "LHR", "date": "2025-12-10", "capacity": 8000, "cargo_type": "Dangerous Goods"}
     ])
 @app.route("/api/qatar")
 def api_qatar():
-    return jsonify([
+    return feed_response([
         {"airline": "Qatar Airways", "flight_no": "QR17", "origin": "DOH", "destination": "LHR", "date": "2025-12-10", "capacity": 8500, "cargo_type": "Pharma"},
         {"airline": "Qatar Airways", "flight_no": "QR571", "origin": "DEL", "destination": "DOH", "date": "2025-12-10", "capacity": 4800, "cargo_type": "General"}
     ])
 
 @app.route("/api/lufthansa")
 def api_lufthansa():
-    return jsonify([
+    return feed_response([
         {"airline": "Lufthansa", "flight_no": "LH401", "origin": "FRA", "destination": "JFK", "date": "2025-12-10", "capacity": 9000, "cargo_type": "Perishables"},
         {"airline": "Lufthansa", "flight_no": "LH900", "origin": "FRA", "destination": "LHR", "date": "2025-12-10", "capacity": 5500, "cargo_type": "General"}
     ])
 @app.route("/api/klm")
 def api_klm():
-    return jsonify([
+    return feed_response([
         {"airline": "KLM", "flight_no": "KL641", "origin": "AMS", "destination": "JFK", "date": "2025-12-10", "capacity": 6200, "cargo_type": "General"},
         {"airline": "KLM", "flight_no": "KL871", "origin": "DEL", "destination": "AMS", "date": "2025-12-10", "capacity": 4300, "cargo_type": "Perishables"}
     ])
@@ -595,54 +524,54 @@ def api_klm():
 
 @app.route("/api/british_airways")
 def api_ba():
-    return jsonify([
+    return feed_response([
         {"airline": "British Airways", "flight_no": "BA108", "origin": "DXB", "destination": "LHR", "date": "2025-12-10", "capacity": 6500, "cargo_type": "High Value"},
         {"airline": "British Airways", "flight_no": "BA118", "origin": "DOH", "destination": "LHR", "date": "2025-12-10", "capacity": 7800, "cargo_type": "General"}
     ])
 
-import requests
+import feed_sync
 
 @app.route("/import_all_airlines", methods=["POST"])
 def import_all_airlines():
-    db = get_db()
-    sources = [
-        "http://127.0.0.1:5000/api/emirates",
-        "http://127.0.0.1:5000/api/qatar",
-        "http://127.0.0.1:5000/api/lufthansa",
-        "http://127.0.0.1:5000/api/klm",
-        "http://127.0.0.1:5000/api/british_airways"
-    ]
-
-    for url in sources:
-        feed = requests.get(url).json()
-        for f in feed:
-            db.execute("""
-                INSERT INTO flights(airline, flight_no, origin, destination, date, capacity, cargo_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (f["airline"], f["flight_no"], f["origin"], f["destination"], f["date"], f["capacity"], f["cargo_type"]))
-
-    db.commit()
+    # sync_feeds invalidates the routing graph and airport index
+    feed_sync.sync_feeds(get_repo().db)
     return redirect("/big_feed")
 
 
+BIG_FEED_CAPACITY = 6000
+
+
 @app.route("/big_feed")
 def big_feed():
-    flights = get_db().execute("SELECT * FROM flights WHERE capacity > 6000").fetchall()
-    return render_template("big_airline_feed.html", flights=flights)
+    flights, next_cursor = get_repo().flights_with_capacity_over(BIG_FEED_CAPACITY, *page_args())
+    return render_template("big_airline_feed.html", flights=flights, next_cursor=next_cursor)
+
+
+@app.route("/api/big_feed")
+def api_big_feed():
+    return page_response(*get_repo().flights_with_capacity_over(BIG_FEED_CAPACITY, *page_args()))
 
 # --------------------------
 # WORKSPACE
 # --------------------------
 @app.route("/workspace", methods=["GET", "POST"])
 def workspace():
-    db = get_db()
+    repo = get_repo()
     if request.method == "POST":
-        db.execute("INSERT INTO messages(sender,text) VALUES(?,?)",
-                   (request.form["sender"], request.form["text"]))
-        db.commit()
+        repo.add_message(request.form["sender"], request.form["text"])
+        pubsub.broker.publish("workspace", "workspace", {
+            "sender": request.form["sender"], "text": request.form["text"]
+        })
+
+    messages, next_cursor = repo.messages(*page_args())
+    # newest page first, oldest message at the top of the page
+    return render_template("workspace.html", messages=messages[::-1], next_cursor=next_cursor)
+
 
-    messages = db.execute("SELECT * FROM messages").fetchall()
-    return render_template("workspace.html", messages=messages)
+@app.route("/api/workspace/messages")
+def api_workspace_messages():
+    """Newest first; "next" continues with older messages."""
+    return page_response(*get_repo().messages(*page_args()))
 
 
 
@@ -650,15 +579,12 @@ def workspace():
 @app.route("/confirm_booking", methods=["POST"])
 def confirm_booking():
     booking_id = request.form["id"]
-    db = get_db()
+    repo = get_repo()
 
     import time
     now = int(time.time())
 
-    b = db.execute(
-        "SELECT * FROM bookings WHERE id=?",
-        (booking_id,)
-    ).fetchone()
+    b = repo.booking(booking_id)
 
     if not b or b["status"] != "HOLD":
         return "Invalid booking"
@@ -666,13 +592,13 @@ def confirm_booking():
     if now > b["expires_at"]:
         return "Hold expired"
 
-    db.execute("""
-        UPDATE bookings
-        SET status='CONFIRMED', confirmed_at=?
-        WHERE id=?
-    """, (now, booking_id))
+    if not repo.confirm_booking(booking_id, now):
+        return "Hold expired"
 
-    db.commit()
+    # have the invoice ready before the first download
+    row = repo.invoice_row(booking_id)
+    if row:
+        invoices.submit(invoices.invoice_data(row))
     return redirect("/bookings")
 
 @app.route("/ai/predict_capacity_ml", methods=["GET","POST"])
@@ -694,49 +620,71 @@ def predict_capacity_ml_route():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@app.route("/ai/predict_capacity_ml/stats")
+def predict_capacity_ml_stats():
+    """Prediction cache counters for monitoring."""
+    stats = prediction_cache.stats()
+    try:
+        stats["model_version"] = model_version()
+    except FileNotFoundError:
+        stats["model_version"] = None
+    return jsonify(stats)
+
+
+MAX_PREDICTION_BATCH = 50000
+
+@app.route("/ai/predict_capacity_ml/batch", methods=["POST"])
+def predict_capacity_ml_batch_route():
+    """
+    JSON body: {"items": [{"origin", "destination", "date", "cargo_type"}, ...]}
+    (or the list itself). Results come back in the same order.
+    """
+    data = request.get_json(silent=True)
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({"ok": False, "error": "items list required"}), 400
+    if len(items) > MAX_PREDICTION_BATCH:
+        return jsonify({"ok": False, "error": f"at most {MAX_PREDICTION_BATCH} items per batch"}), 400
+
+    queries = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("origin") or not item.get("destination"):
+            return jsonify({"ok": False, "error": f"item {i}: origin and destination required"}), 400
+        queries.append((item["origin"], item["destination"], item.get("date"),
+                        item.get("cargo_type") or "General"))
+    try:
+        return jsonify({"ok": True, "results": predict_capacity_ml_batch(queries)})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+
 @app.route("/ai/chat", methods=["POST"])
 def ai_chat():
     try:
         data = request.get_json()
         msg = data.get("message", "").upper()
 
-        db = get_db()
+        index = airports.get_index(get_repo().db)
 
         # ------------------------------------------
-        # 1️⃣ AIRPORT EXTRACTION (Dynamic Detection)
+        # 1️⃣ AIRPORT EXTRACTION (codes and city names, from memory)
         # ------------------------------------------
-        airports = ["DEL","DXB","DOH","FRA","JFK","LHR","AMS","BOM","MAA","HYD"]
-
-        origin = None
-        destination = None
-
-        for ap in airports:
-            if f"{ap}" in msg:
-                if origin is None:
-                    origin = ap
-                elif destination is None:
-                    destination = ap
-
-        # If user typed "FRA - JFK" or "FRA to JFK"
-        import re
-        match = re.findall(r'\b[A-Z]{3}\b', msg)
-        if len(match) >= 2:
-            origin = match[0]
-            destination = match[1]
+        found = index.resolve(data.get("message", ""))
+        origin, destination = (found + [None, None])[:2]
 
         # ------------------------------------------
         # 2️⃣ Give real route answer if airports found
         # ------------------------------------------
         if origin and destination:
-            flights = db.execute(
-                "SELECT airline, flight_no, capacity FROM flights WHERE origin=? AND destination=?",
-                (origin, destination)
-            ).fetchall()
+            route = index.route(origin, destination)
 
-            if flights:
+            if route:
                 ans = f"Best routes from {origin} → {destination}:\n"
-                for f in flights:
-                    ans += f"• {f['airline']} {f['flight_no']} – Capacity: {f['capacity']} kg\n"
+                for airline, flight_no, _date, capacity in route["best"]:
+                    ans += f"• {airline} {flight_no} – Capacity: {capacity} kg\n"
+                more = route["flights"] - len(route["best"])
+                if more > 0:
+                    ans += f"…and {more} more flights ({route['capacity']} kg in total)\n"
                 return jsonify({"ok": True, "response": {"text": ans}})
             else:
                 return jsonify({
@@ -775,46 +723,168 @@ def ai_chat():
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)})
 
-from flask import send_file
-from reportlab.pdfgen import canvas
-import os
+# --------------------------
+# AI ASSISTANT (streamed from the Ollama server)
+# --------------------------
+from flask import Response
+import itertools
+import ai_module
 
-@app.route("/download_invoice/<int:booking_id>")
-def download_invoice(booking_id):
-    print("INVOICE ROUTE WORKING FOR ID:", booking_id)   # DEBUG PRINT
 
-    db = get_db()
+def sse_response(tokens):
+    """
+    Stream tokens as server-sent events: one "data" event per token, then a
+    "done" event with the cleaned full answer (or an "error" event). The
+    first token is awaited before the response starts, so a request that
+    gets no model slot is answered 429 (llm_busy) rather than opening a
+    stream.
+    """
+    tokens = iter(tokens)
+    error = None
+    try:
+        head = list(itertools.islice(tokens, 1))
+    except llm_slots.Busy:
+        raise
+    except Exception as e:
+        head, error = [], e
+
+    def events():
+        text = []
+        try:
+            if error is not None:
+                raise error
+            for token in itertools.chain(head, tokens):
+                text.append(token)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            answer = ai_module.clean_output("".join(text))
+            yield f"event: done\ndata: {json.dumps({'text': answer})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': f'AI engine error: {e}'})}\n\n"
 
-    booking = db.execute("SELECT * FROM bookings WHERE id=?", (booking_id,)).fetchone()
-    if not booking:
-        return "Booking not found"
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/ai/assistant/stream")
+def ai_assistant_stream():
+    message = request.args.get("message", "").strip()
+    if not message:
+        return jsonify({"ok": False, "error": "message required"}), 400
+    return sse_response(ai_module.chat_with_ai(message, stream=True))
 
-    flight = db.execute("SELECT * FROM flights WHERE id=?", (booking['flight_id'],)).fetchone()
 
-    # File path
-    filepath = f"invoice_{booking_id}.pdf"
+@app.route("/ai/cargo_risk/stream")
+def ai_cargo_risk_stream():
+    cargo_type = request.args.get("cargo_type", "General")
+    return sse_response(ai_module.cargo_risk(cargo_type, stream=True))
 
-    # Create PDF
-    c = canvas.Canvas(filepath)
-    c.setFont("Helvetica", 12)
 
-    c.drawString(40, 800, "CARGO AIRWAY BILL / INVOICE")
-    c.drawString(40, 780, f"Invoice #: {booking_id}")
-    c.drawString(40, 760, f"Flight: {flight['airline']} {flight['flight_no']}")
-    c.drawString(40, 740, f"Route: {flight['origin']} → {flight['destination']}")
-    c.drawString(40, 720, f"Date: {flight['date']}")
+@app.route("/ai/analyze_route/stream")
+def ai_analyze_route_stream():
+    ids = [request.args.get(k, type=int) for k in ("flight1", "flight2")]
+    flights = get_repo().flights_by_id(ids)
+    legs = [flights.get(i) for i in ids]
+    if None in legs:
+        return jsonify({"ok": False, "error": "flight1 and flight2 must be flight ids"}), 400
+    return sse_response(ai_module.analyze_route(dict(legs[0]), dict(legs[1]), stream=True))
 
-    c.drawString(40, 690, f"Actual Weight: {booking['actual_weight']} kg")
-    c.drawString(40, 670, f"Volumetric Weight: {booking['volumetric_weight']:.2f} kg")
-    c.drawString(40, 650, f"Chargeable Weight: {booking['chargeable_weight']:.2f} kg")
+# --------------------------
+# AI JOBS (queued behind a fixed number of model workers; poll for answers)
+# --------------------------
+@app.errorhandler(llm_slots.Busy)
+def llm_busy(e):
+    # every model slot (or the job queue) is full: tell the client to back off
+    return jsonify({"ok": False, "error": str(e)}), 429, {"Retry-After": "5"}
 
-    c.drawString(40, 620, f"Rate per kg: ₹{booking['price']}")
-    c.drawString(40, 600, f"Total Amount: ₹{booking['total']:.2f}")
 
-    c.drawString(40, 560, "Thank you for choosing Cargo Network Portal!")
-    c.save()
+@app.route("/ai/jobs", methods=["POST"])
+def ai_job_submit():
+    if not is_logged_in():
+        return jsonify({"ok": False, "error": "login required"}), 401
+    data = request.get_json(silent=True) or request.form
+    prompt = (data.get("prompt") or "").strip()
+    backend = data.get("backend", "ollama")
+    if not prompt:
+        return jsonify({"ok": False, "error": "prompt required"}), 400
+    if backend not in llm_queue.BACKENDS:
+        return jsonify({"ok": False, "error": f"backend must be one of {sorted(llm_queue.BACKENDS)}"}), 400
+
+    job_id = llm_queue.get_queue().submit(prompt, backend, owner=session["user_id"])
+    return jsonify({"ok": True, "job_id": job_id, "status_url": f"/ai/jobs/{job_id}"}), 202
+
+
+@app.route("/ai/jobs/<job_id>")
+def ai_job_status(job_id):
+    if not is_logged_in():
+        return jsonify({"ok": False, "error": "login required"}), 401
+    job = llm_queue.get_queue().job(job_id)
+    # someone else's job looks the same as one that does not exist
+    if job is None or job.pop("owner") != session["user_id"]:
+        return jsonify({"ok": False, "error": "unknown or expired job"}), 404
+    return jsonify({"ok": True, "job": job})
+
+
+@app.route("/ai/jobs/stats")
+def ai_job_stats():
+    if not is_logged_in():
+        return jsonify({"ok": False, "error": "login required"}), 401
+    return jsonify(llm_queue.get_queue().stats())
+
+
+@app.route("/ai/cache/stats")
+def ai_cache_stats():
+    if not is_logged_in():
+        return jsonify({"ok": False, "error": "login required"}), 401
+    return jsonify(llm_cache.cache.stats())
+
+from flask import send_file, stream_with_context
+import datetime
+import os
+import invoices
+
+@app.route("/download_invoice/<int:booking_id>")
+def download_invoice(booking_id):
+    row = get_repo().invoice_row(booking_id)
+    if not row:
+        return "Booking not found"
+
+    # rendered once per version of the booking, see invoices.py
+    path, key = invoices.ensure(invoices.invoice_data(row))
+    return send_file(path, as_attachment=True, download_name=f"invoice_{booking_id}.pdf",
+                     etag=key, max_age=0)
+
+
+@app.route("/invoices/export")
+def export_invoices():
+    """
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD: one ZIP with the invoices of every
+    confirmed booking the user can see on flights in that range, streamed
+    while it is built.
+    """
+    if not is_logged_in():
+        return redirect("/login")
+
+    date_from = request.args.get("from") or None
+    date_to = request.args.get("to") or None
+    try:
+        for value in (date_from, date_to):
+            if value:
+                datetime.date.fromisoformat(value)
+    except ValueError:
+        return jsonify({"ok": False, "error": "from and to must be YYYY-MM-DD"}), 400
+
+    repo = get_repo()
+    user = repo.user(session["user_id"])
+    rows = all_pages(lambda cursor: repo.invoice_page(
+        user, date_from, date_to, cursor, storage.MAX_PAGE_SIZE
+    ))
+    name = f"invoices_{date_from or 'all'}_{date_to or 'all'}.zip"
+    # stream_with_context keeps the request's connection for the paged reads
+    return Response(stream_with_context(invoices.stream_zip(rows)),
+                    mimetype="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
 
-    return send_file(filepath, as_attachment=True)
 from werkzeug.utils import secure_filename
 
 PROFILE_UPLOAD_FOLDER = "profile_pics"
@@ -827,8 +897,7 @@ def profile():
     if not is_logged_in():
         return redirect("/login")
 
-    db = get_db()
-    user = db.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
+    user = get_repo().user(session["user_id"])
     return render_template("profile.html", user=user)
 
 
@@ -837,7 +906,7 @@ def edit_profile():
     if not is_logged_in():
         return redirect("/login")
 
-    db = get_db()
+    repo = get_repo()
 
     if request.method == "POST":
         email = request.form["email"]
@@ -851,16 +920,10 @@ def edit_profile():
             filename = secure_filename(file.filename)
             file.save(os.path.join(PROFILE_UPLOAD_FOLDER, filename))
 
-            db.execute("UPDATE users SET profile_pic=? WHERE id=?", (filename, session["user_id"]))
-
-        db.execute("""
-            UPDATE users SET email=?, phone=?, company=? WHERE id=?
-        """, (email, phone, company, session["user_id"]))
-
-        db.commit()
+        repo.update_profile(session["user_id"], email, phone, company, profile_pic=filename)
         return redirect("/profile")
 
-    user = db.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
+    user = repo.user(session["user_id"])
     return render_template("edit_profile.html", user=user)
 @app.route('/profile_pics/<filename>')
 def profile_pic(filename):
@@ -871,39 +934,23 @@ def map_view():
     return render_template("map.html")
 @app.route("/api/all_routes")
 def api_all_routes():
-    db = get_db()
-    flights = db.execute("SELECT origin, destination FROM flights").fetchall()
-
-    # airport coords: (Add more later)
-    airport_coords = {
-        "DEL": {"lat": 28.5562, "lng": 77.1000},
-        "DXB": {"lat": 25.2532, "lng": 55.3657},
-        "DOH": {"lat": 25.2854, "lng": 51.5310},
-        "LHR": {"lat": 51.4700, "lng": -0.4543},
-        "JFK": {"lat": 40.6413, "lng": -73.7781},
-        "FRA": {"lat": 50.0379, "lng": 8.5622}
-    }
-
-    routes = []
-
-    for f in flights:
-        origin = airport_coords.get(f["origin"])
-        dest = airport_coords.get(f["destination"])
+    """
+    One arc per origin→destination with its flight count and remaining
+    capacity, placed from data/airports.csv. The JSON is cached until the
+    flights change and carries an ETag for conditional requests.
+    """
+    body, etag = airports.route_map(get_repo().db)
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True   # revalidate, usually a 304
+    return resp.make_conditional(request)
 
-        if origin and dest:
-            routes.append({
-                "startLat": origin["lat"],
-                "startLng": origin["lng"],
-                "endLat": dest["lat"],
-                "endLng": dest["lng"]
-            })
 
-    return jsonify(routes)
 @app.route("/chat/<int:booking_id>", methods=["GET", "POST"])
 def chat(booking_id):
-    db = get_db()
+    repo = get_repo()
 
-    booking = db.execute("SELECT * FROM bookings WHERE id=?", (booking_id,)).fetchone()
+    booking = repo.booking(booking_id)
     if not booking:
         return "Booking not found"
 
@@ -912,41 +959,89 @@ def chat(booking_id):
 
     if request.method == "POST":
         msg = request.form["message"]
-        db.execute("""
-            INSERT INTO booking_messages(booking_id, sender_id, message, timestamp)
-            VALUES (?, ?, ?, datetime('now'))
-        """, (booking_id, user_id, msg))
-        db.commit()
+        receiver_id = repo.chat_receiver(booking, user_id)
+        sent = repo.add_booking_message(booking_id, user_id, msg, receiver_id)
+        pubsub.broker.publish(f"booking:{booking_id}", "chat", sent)
+        if receiver_id is not None:
+            pubsub.broker.add_unread(receiver_id, 1)
         return redirect(f"/chat/{booking_id}")
 
-    messages = db.execute(
-        "SELECT * FROM booking_messages WHERE booking_id=? ORDER BY id ASC",
-        (booking_id,)
-    ).fetchall()
+    mark_chat_read(repo, booking_id, user_id)
+    messages, next_cursor = repo.booking_messages(booking_id, *page_args())
+
+    return render_template("chat.html", booking=booking, messages=messages[::-1],
+                           next_cursor=next_cursor)
+
+
+@app.route("/api/chat/<int:booking_id>/messages")
+def api_chat_messages(booking_id):
+    """Newest first; "next" continues with older messages."""
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "login required"}), 401
+    repo = get_repo()
+    if not repo.booking(booking_id):
+        return jsonify({"ok": False, "error": "booking not found"}), 404
+    return page_response(*repo.booking_messages(booking_id, *page_args()))
+
+
+def mark_chat_read(repo, booking_id, user_id):
+    read = repo.mark_read(booking_id, user_id)
+    if read:
+        pubsub.broker.add_unread(user_id, -read)
+
+
+@app.route("/chat/<int:booking_id>/read", methods=["POST"])
+def chat_read(booking_id):
+    """Called by an open chat page when a pushed message arrives."""
+    if "user_id" not in session:
+        return jsonify({"ok": False}), 401
+    mark_chat_read(get_repo(), booking_id, session["user_id"])
+    return jsonify({"ok": True})
+
 
-    return render_template("chat.html", booking=booking, messages=messages)
 @app.route("/chat/unread_count")
 def unread_count():
     if "user_id" not in session:
         return jsonify({"unread": 0})
 
-    db = get_db()
-    unread = db.execute("""
-        SELECT COUNT(*) AS c FROM booking_messages
-        WHERE receiver_id = ? AND is_read = 0
-    """, (session["user_id"],)).fetchone()["c"]
+    user_id = session["user_id"]
+    unread = pubsub.broker.unread_count(user_id, lambda: get_repo().unread_count(user_id))
 
     return jsonify({"unread": unread})
+
+
+# --------------------------
+# LIVE UPDATES (server-sent events)
+# --------------------------
+@app.route("/events")
+def events():
+    """
+    One stream per open page: unread counts, workspace posts and, with
+    ?booking=<id>, that booking's chat messages.
+    """
+    if "user_id" not in session:
+        return "", 204   # tells EventSource not to reconnect
+
+    user_id = session["user_id"]
+    channels = [f"user:{user_id}", "workspace"]
+    booking_id = request.args.get("booking", type=int)
+    if booking_id is not None:
+        channels.append(f"booking:{booking_id}")
+
+    unread = pubsub.broker.unread_count(user_id, lambda: get_repo().unread_count(user_id))
+    sub = pubsub.broker.subscribe(channels)
+    return Response(pubsub.stream(sub, first=("unread", {"unread": unread})),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route("/cancel_booking/<int:id>")
 @app.route("/cancel_booking/<int:booking_id>")
 def cancel_booking(booking_id):
-    db = get_db()
+    repo = get_repo()
     import time
 
-    b = db.execute(
-        "SELECT * FROM bookings WHERE id=?",
-        (booking_id,)
-    ).fetchone()
+    b = repo.booking(booking_id)
 
     if not b or b["status"] != "CONFIRMED":
         return "Cannot cancel"
@@ -958,22 +1053,9 @@ def cancel_booking(booking_id):
         return "Penalty required to cancel after 5 minutes"
 
     # Restore capacity
-    flight = db.execute(
-        "SELECT * FROM flights WHERE id=?",
-        (b["flight_id"],)
-    ).fetchone()
-
-    db.execute(
-        "UPDATE flights SET capacity = capacity + ? WHERE id=?",
-        (b["chargeable_weight"], b["flight_id"])
-    )
-
-    db.execute(
-        "UPDATE bookings SET status='CANCELLED' WHERE id=?",
-        (booking_id,)
-    )
+    if not repo.release_booking(booking_id, "CONFIRMED", "CANCELLED"):
+        return "Cannot cancel"
 
-    db.commit()
     return redirect("/bookings")
 
 @app.route("/modify_booking/<int:id>")
@@ -982,13 +1064,10 @@ def modify_booking(booking_id):
     if current_role() != "forwarder":
         return "Unauthorized"
 
-    db = get_db()
+    repo = get_repo()
     import time
 
-    booking = db.execute(
-        "SELECT * FROM bookings WHERE id=?",
-        (booking_id,)
-    ).fetchone()
+    booking = repo.booking(booking_id)
 
     if not booking or booking["status"] != "CONFIRMED":
         return "Invalid booking"
@@ -999,28 +1078,44 @@ def modify_booking(booking_id):
     if now > allowed_until:
         return "Modification window expired. Penalty required."
 
-    # 1️⃣ Restore flight capacity
-    db.execute("""
-        UPDATE flights
-        SET capacity = capacity + ?
-        WHERE id=?
-    """, (booking["chargeable_weight"], booking["flight_id"]))
-
-    # 2️⃣ Mark booking as MODIFY_PENDING
-    db.execute("""
-        UPDATE bookings
-        SET status='MODIFY_PENDING'
-        WHERE id=?
-    """, (booking_id,))
-
-    db.commit()
+    # 1️⃣ Restore flight capacity and 2️⃣ mark booking as MODIFY_PENDING
+    if not repo.release_booking(booking_id, "CONFIRMED", "MODIFY_PENDING"):
+        return "Invalid booking"
 
     # 3️⃣ Redirect back to forwarder search
     return redirect("/forwarder_search")
 
 
+# --------------------------
+# PRELOAD
+# --------------------------
+def preload():
+    """
+    Import the heavy libraries and load the capacity model now instead of on
+    first use. Run it once in the master of a pre-forking server (gunicorn
+    --preload with CARGO_PRELOAD=1) so workers share them copy-on-write.
+    GPT4All is not loaded here: it starts native threads, which do not
+    survive the fork, so each worker loads it itself (llm_integration.warm_up).
+    """
+    import pandas
+    import numpy
+    from reportlab.pdfgen import canvas
+
+    try:
+        predict_capacity_ml("DEL", "DXB")   # prediction table, or the model
+    except FileNotFoundError:
+        pass
+
+
+if os.environ.get("CARGO_PRELOAD"):
+    preload()
+
+
 if __name__ == "__main__":
     with app.app_context():
         init_db()
 
+    if os.environ.get("FEED_SYNC_INTERVAL"):
+        feed_sync.start_background_sync(int(os.environ["FEED_SYNC_INTERVAL"]))
+
     app.run(debug=True)
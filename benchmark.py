@@ -0,0 +1,777 @@
+# benchmark.py
+# Performance benchmarks for the cargo platform.
+#
+#   python benchmark.py search [10000 100000 1000000]
+#   python benchmark.py route [1000000]
+#   python benchmark.py ingest [1000000]
+#   python benchmark.py optimizer [100000]
+#   python benchmark.py expiry [100000]
+#   python benchmark.py contention [32]
+#   python benchmark.py pool [16]
+#   python benchmark.py predict [10000]
+#   python benchmark.py startup [5]       # exits 1 over STARTUP_BUDGET_MS
+#   python benchmark.py llm [20]
+#   python benchmark.py chat [1000000]
+#   python benchmark.py pages [1000000]
+#   python benchmark.py invoices [2000]
+#   python benchmark.py map [1000000]
+#
+import os
+import sys
+import time
+import csv
+import json
+import random
+import resource
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+
+import database
+import routing
+import ingest
+import utilization
+import hold_expiry
+import reservations
+
+AIRPORTS = ["DEL", "DXB", "DOH", "FRA", "JFK", "LHR", "AMS", "BOM", "MAA", "HYD",
+            "SIN", "LAX", "CDG", "HKG", "NRT", "ORD", "IST", "SYD", "GRU", "JNB"]
+AIRLINES = ["Emirates", "Qatar Airways", "Lufthansa", "KLM", "British Airways", "Air India"]
+CARGO_TYPES = ["General", "Pharma", "Dangerous Goods", "High Value", "Perishables", "Animals"]
+
+
+# --------------------------
+# HELPERS
+# --------------------------
+def synthetic_flights(n, days=90, seed=42):
+    rng = random.Random(seed)
+    for i in range(n):
+        origin, destination = rng.sample(AIRPORTS, 2)
+        dep = rng.randrange(0, 24 * 60)
+        duration = rng.randrange(60, 16 * 60)
+        arr = (dep + duration) % (24 * 60)
+        yield (
+            rng.choice(AIRLINES),
+            f"XX{i}",
+            origin,
+            destination,
+            f"2025-{1 + (i % days) // 30:02d}-{1 + (i % days) % 28:02d}",
+            rng.randrange(500, 12000),
+            rng.choice(CARGO_TYPES),
+            f"{dep // 60:02d}:{dep % 60:02d}",
+            f"{arr // 60:02d}:{arr % 60:02d}",
+            duration,
+        )
+
+
+def make_db(n):
+    """Fresh schema-managed database with n synthetic flights."""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    database.init_db(path)
+
+    db = sqlite3.connect(path)
+    db.executemany("""
+        INSERT INTO flights (airline, flight_no, origin, destination, date,
+                             capacity, cargo_type, departure_time, arrival_time,
+                             duration_minutes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, synthetic_flights(n))
+    db.commit()
+    db.row_factory = sqlite3.Row
+    return db, path
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+# --------------------------
+# SEARCH LATENCY
+# --------------------------
+def search_queries(db, origin, destination, date):
+    db.execute(
+        "SELECT * FROM flights WHERE origin=? AND destination=? AND date=? AND cargo_type=?",
+        (origin, destination, date, "General")
+    ).fetchall()
+    db.execute("SELECT * FROM flights WHERE origin=? AND date=?", (origin, date)).fetchall()
+    db.execute("SELECT * FROM flights WHERE destination=? AND date=?", (destination, date)).fetchall()
+    db.execute(
+        "SELECT airline, flight_no, capacity FROM flights WHERE origin=? AND destination=?",
+        (origin, destination)
+    ).fetchall()
+
+
+def bench_search(sizes):
+    print(f"{'flights':>10} {'no index (ms)':>15} {'indexed (ms)':>14} {'speedup':>8}")
+    for n in sizes:
+        db, path = make_db(n)
+        run = lambda: search_queries(db, "DEL", "JFK", "2025-01-05")
+        repeat = 20 if n <= 100000 else 5
+
+        for name in database.INDEXES:
+            db.execute(f"DROP INDEX {name}")
+        before = timed(run, repeat)
+
+        database.migrate(db)
+        db.execute("ANALYZE")
+        after = timed(run, repeat)
+
+        print(f"{n:>10} {before:>15.2f} {after:>14.2f} {before / after:>7.0f}x")
+        db.close()
+        os.remove(path)
+
+
+# --------------------------
+# INTERLINE ROUTING
+# --------------------------
+def bench_route(sizes):
+    for n in sizes:
+        db, path = make_db(n)
+
+        start = time.perf_counter()
+        graph = routing.get_graph(db)
+        build = time.perf_counter() - start
+
+        queries = [("DEL", "JFK", f"2025-01-{d:02d}") for d in range(1, 29)]
+        found = 0
+        start = time.perf_counter()
+        for origin, destination, date in queries:
+            found += len(graph.search(origin, destination, date, min_legs=2))
+        per_query = (time.perf_counter() - start) / len(queries) * 1000
+
+        print(f"{n} flights: graph build {build:.1f}s, "
+              f"DEL->JFK {per_query:.1f} ms/query ({found / len(queries):.1f} itineraries)")
+        db.close()
+        os.remove(path)
+
+
+# --------------------------
+# BULK SCHEDULE INGESTION
+# --------------------------
+def bench_ingest(sizes):
+    for n in sizes:
+        fd, csv_path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(ingest.FLIGHT_COLUMNS)
+            for row in synthetic_flights(n):
+                # columns are ordered like the DB insert, dates as DD/MM/YYYY
+                y, m, d = row[4].split("-")
+                writer.writerow(row[:4] + (f"{d}/{m}/{y}",) + row[5:])
+
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        database.init_db(db_path)
+        db = sqlite3.connect(db_path)
+
+        stats = ingest.load_file(db, csv_path)
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{n} rows: {stats['seconds']}s, {stats['rows_per_sec']} rows/sec, "
+              f"peak RSS {peak_mb:.0f} MB")
+
+        db.close()
+        os.remove(csv_path)
+        os.remove(db_path)
+
+
+# --------------------------
+# AIRLINE OPTIMIZER
+# --------------------------
+def add_bookings(db, n, flights, status="CONFIRMED", seed=7):
+    rng = random.Random(seed)
+    db.executemany("""
+        INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight,
+                              status, expires_at, price, total)
+        VALUES (?, ?, ?, ?, ?, ?, 12, 0)
+    """, (
+        (1, rng.randint(1, flights), w, w, status, int(time.time()) + 120)
+        for w in (rng.randint(10, 500) for _ in range(n))
+    ))
+    db.commit()
+
+
+def optimizer_loops(db):
+    """The per-booking dashboard path this replaced (N+1 queries)."""
+    flights = db.execute("SELECT * FROM flights").fetchall()
+    bookings = db.execute("SELECT * FROM bookings WHERE status='CONFIRMED'").fetchall()
+    route_stats = {}
+    for f in flights:
+        route = f"{f['origin']} → {f['destination']}"
+        route_stats.setdefault(route, {"capacity": 0, "used": 0})
+        route_stats[route]["capacity"] += f["capacity"]
+    for b in bookings:
+        flight = db.execute("SELECT * FROM flights WHERE id=?", (b["flight_id"],)).fetchone()
+        if flight:
+            route_stats[f"{flight['origin']} → {flight['destination']}"]["used"] += b["weight"]
+    return route_stats
+
+
+def bench_optimizer(sizes):
+    for n in sizes:
+        db, path = make_db(n)
+        add_bookings(db, n, n)
+
+        before = timed(lambda: optimizer_loops(db), 1)
+        rebuild = timed(lambda: utilization.rebuild(db), 1)
+        after = timed(lambda: utilization.route_totals(db), 5)
+        print(f"{n} flights / {n} bookings: loops {before:.0f} ms, "
+              f"summary rebuild {rebuild:.0f} ms, summary read {after:.1f} ms")
+        db.close()
+        os.remove(path)
+
+
+# --------------------------
+# HOLD EXPIRY
+# --------------------------
+MAX_EXPIRY_DELAY = 2.0   # seconds past expiry a hold may stay HOLD
+
+
+def bench_expiry(sizes):
+    for n in sizes:
+        db, path = make_db(1000)
+        start_capacity = db.execute("SELECT SUM(capacity) FROM flights").fetchone()[0]
+
+        # n holds expiring over the next 5 seconds, capacity already taken
+        rng = random.Random(3)
+        now = int(time.time())
+        holds = [(rng.randint(1, 1000), rng.randint(10, 500), now + rng.randint(1, 5))
+                 for _ in range(n)]
+        db.executemany("""
+            INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight, status, expires_at)
+            VALUES (1, ?, ?, ?, 'HOLD', ?)
+        """, ((f, w, w, e) for f, w, e in holds))
+        db.executemany("UPDATE flights SET capacity = capacity - ? WHERE id=?",
+                       ((w, f) for f, w, _ in holds))
+        utilization.rebuild(db)
+        db.commit()
+
+        worker = hold_expiry.HoldExpiryWorker(path, sweep_interval=3600).start()
+        deadline = now + 6 + MAX_EXPIRY_DELAY
+        while time.time() < deadline + 5:
+            left = db.execute("SELECT COUNT(*) FROM bookings WHERE status='HOLD'").fetchone()[0]
+            if not left:
+                break
+            time.sleep(0.1)
+        worker.stop()
+
+        end_capacity = db.execute("SELECT SUM(capacity) FROM flights").fetchone()[0]
+        stats = worker.stats
+        print(f"{n} holds: {stats['expired']} expired in {stats['batches']} batches, "
+              f"max delay {stats['max_delay']:.2f}s, {left} still held, "
+              f"capacity restored: {abs(end_capacity - start_capacity) < 0.01}, "
+              f"summary drift: {len(utilization.check(db))}")
+        assert left == 0 and stats["max_delay"] <= MAX_EXPIRY_DELAY
+
+        db.close()
+        os.remove(path)
+
+
+# --------------------------
+# BOOKING CONTENTION
+# --------------------------
+def naive_book(db, flight_id, weight):
+    """The old read-check-write booking path, kept for comparison."""
+    capacity = db.execute("SELECT capacity FROM flights WHERE id=?", (flight_id,)).fetchone()[0]
+    if weight > capacity:
+        db.rollback()
+        return False
+    db.execute("UPDATE flights SET capacity=? WHERE id=?", (capacity - weight, flight_id))
+    db.execute("""
+        INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight, status, expires_at)
+        VALUES (1, ?, ?, ?, 'HOLD', 0)
+    """, (flight_id, weight, weight))
+    db.commit()
+    return True
+
+
+def atomic_book(db, flight_id, weight):
+    with reservations.write_transaction(db):
+        if not reservations.reserve(db, flight_id, weight):
+            return False
+        db.execute("""
+            INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight, status, expires_at)
+            VALUES (1, ?, ?, ?, 'HOLD', 0)
+        """, (flight_id, weight, weight))
+    return True
+
+
+def hammer(path, book, threads, capacity=20000, weight=10):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    flight_id = db.execute(
+        "INSERT INTO flights (airline, flight_no, origin, destination, date, capacity, cargo_type) "
+        "VALUES ('Emirates', 'EK1', 'DXB', 'LHR', '2025-12-10', ?, 'General')", (capacity,)
+    ).lastrowid
+    db.commit()
+
+    errors = []
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        conn = sqlite3.connect(path, timeout=30)
+        barrier.wait()
+        try:
+            while True:
+                # each thread keeps booking until the flight is sold out
+                if not book(conn, flight_id, weight):
+                    break
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    seconds = time.perf_counter() - start
+
+    booked, count = db.execute(
+        "SELECT COALESCE(SUM(weight), 0), COUNT(*) FROM bookings WHERE flight_id=?", (flight_id,)
+    ).fetchone()
+    left = db.execute("SELECT capacity FROM flights WHERE id=?", (flight_id,)).fetchone()[0]
+    db.close()
+    return {
+        "bookings": count,
+        "oversold": max(0, booked - capacity),
+        "balanced": booked + left == capacity,
+        "errors": len(errors),
+        "per_sec": int(count / seconds) if seconds else count,
+    }
+
+
+def bench_contention(sizes):
+    for threads in sizes:
+        for name, book in (("read-check-write", naive_book), ("atomic", atomic_book)):
+            db, path = make_db(0)
+            db.close()
+            r = hammer(path, book, threads)
+            print(f"{threads} threads {name:>16}: {r['bookings']} bookings, "
+                  f"{r['per_sec']} bookings/s, oversold {r['oversold']} kg, "
+                  f"capacity balanced: {r['balanced']}, lock errors: {r['errors']}")
+            os.remove(path)
+
+
+# --------------------------
+# CONNECTION POOL
+# --------------------------
+def unpooled_get_db():
+    """get_db as it was: a fresh connection per request, never closed."""
+    from flask import g
+
+    db = getattr(g, "_unpooled_database", None)
+    if db is None:
+        db = g._unpooled_database = sqlite3.connect(database.DATABASE)
+        db.row_factory = sqlite3.Row
+    return db
+
+
+def load_test(port, clients, requests_per_client, paths):
+    import http.client
+
+    errors = []
+
+    def client(i):
+        for j in range(requests_per_client):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            try:
+                conn.request("GET", paths[(i + j) % len(paths)])
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errors.append(resp.status)
+            finally:
+                conn.close()
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    seconds = time.perf_counter() - start
+    return int(clients * requests_per_client / seconds), len(errors)
+
+
+def bench_pool(sizes):
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    db, path = make_db(500)
+    db.close()
+    database.DATABASE = path
+    import app as webapp
+
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    paths = ["/big_feed", "/api/all_routes", "/workspace"]
+    pooled_get_db = database.get_db
+
+    for clients in sizes:
+        for name, get_db in (("connect per request", unpooled_get_db), ("pooled", pooled_get_db)):
+            database.get_db = get_db
+            load_test(server.port, clients, 5, paths)   # warm up
+            rps, errors = load_test(server.port, clients, 100, paths)
+            print(f"{clients} clients {name:>19}: {rps} req/s, {errors} errors")
+
+    database.get_db = pooled_get_db
+    server.shutdown()
+    os.remove(path)
+
+
+# --------------------------
+# ML CAPACITY PREDICTION
+# --------------------------
+def bench_predict(sizes):
+    import warnings
+    import ai_ml
+
+    warnings.filterwarnings("ignore")   # sklearn pickle version notices
+    ai_ml.load_model()
+    rng = random.Random(5)
+    for n in sizes:
+        queries = [
+            (rng.choice(AIRPORTS), rng.choice(AIRPORTS),
+             f"2025-{rng.randint(1, 12):02d}-01", rng.choice(CARGO_TYPES))
+            for _ in range(n)
+        ]
+
+        # model path only: no table, no cache
+        table_path = ai_ml.TABLE_PATH
+        ai_ml.TABLE_PATH = os.devnull + ".missing"
+        ai_ml.prediction_cache.maxsize = 0
+        start = time.perf_counter()
+        per_row = [ai_ml.predict_capacity_ml(*q) for q in queries]
+        row_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = ai_ml.predict_capacity_ml_batch(queries)
+        batch_seconds = time.perf_counter() - start
+
+        assert per_row == batch
+        print(f"{n} predictions: per row {row_seconds:.2f}s, batch {batch_seconds:.3f}s "
+              f"({row_seconds / batch_seconds:.0f}x)")
+
+        # same queries again, one at a time, through the LRU cache
+        ai_ml.prediction_cache.maxsize = ai_ml.CACHE_SIZE
+        ai_ml.prediction_cache.clear()
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            cached = [ai_ml.predict_capacity_ml(*q) for q in queries]
+            seconds = time.perf_counter() - start
+            assert cached == per_row
+            stats = ai_ml.prediction_cache.stats()
+            print(f"{n} cached per-row predictions ({label}): {seconds:.2f}s, "
+                  f"hit ratio {stats['hit_ratio']:.0%}, {stats['size']} entries")
+
+        # precomputed table (python train_capacity.py --table-only)
+        ai_ml.TABLE_PATH = table_path
+        ai_ml.prediction_cache.clear()
+        if ai_ml.load_table(ai_ml.model_version()) is None:
+            print("no prediction table for this model, skipping table timing")
+            continue
+        start = time.perf_counter()
+        looked_up = [ai_ml.predict_capacity_ml(*q) for q in queries]
+        seconds = time.perf_counter() - start
+        assert looked_up == per_row and ai_ml.prediction_cache.stats()["misses"] == 0
+        print(f"{n} table per-row predictions: {seconds:.3f}s "
+              f"({seconds / n * 1e6:.1f} us each, {row_seconds / seconds:.0f}x)")
+
+
+# --------------------------
+# STARTUP
+# --------------------------
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 500))
+# must not be imported by "import app"; they load on first use or in preload()
+LAZY_MODULES = ("pandas", "numpy", "PyPDF2", "reportlab", "requests",
+                "joblib", "sklearn", "gpt4all", "openai")
+
+
+def import_times():
+    """{module: cumulative microseconds} from one cold `python -X importtime`."""
+    env = {k: v for k, v in os.environ.items() if k != "CARGO_PRELOAD"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def bench_startup(sizes):
+    runs = sizes[0]
+    samples = [import_times() for _ in range(runs)]
+    startup = statistics.median(t["app"] for t in samples) / 1000
+    print(f"import app: {startup:.0f} ms (median of {runs}, budget {STARTUP_BUDGET_MS:.0f} ms)")
+
+    last = samples[-1]
+    direct = sorted(
+        ((us, name) for name, us in last.items() if "." not in name and name != "app"),
+        reverse=True,
+    )
+    for us, name in direct[:8]:
+        print(f"  {name:<24} {us / 1000:7.1f} ms")
+
+    eager = sorted({name.split(".")[0] for name in last} & set(LAZY_MODULES))
+    if eager:
+        print("imported at startup but should be lazy:", ", ".join(eager))
+    if eager or startup > STARTUP_BUDGET_MS:
+        sys.exit(1)
+
+
+# --------------------------
+# LLM CLIENT (against llm_stub.py)
+# --------------------------
+def bench_llm(sizes):
+    import requests
+    import ai_module
+    import llm_stub
+
+    server = llm_stub.serve(token_delay=0.005)
+    ai_module.OLLAMA_URL = f"http://127.0.0.1:{server.server_port}"
+    prompt = " ".join(f"word{i}" for i in range(50))
+    for calls in sizes:
+        # streamed: how long until the browser sees something
+        first, total = [], []
+        for _ in range(calls):
+            start = time.perf_counter()
+            for i, _token in enumerate(ai_module.stream_ai(prompt)):
+                if i == 0:
+                    first.append(time.perf_counter() - start)
+            total.append(time.perf_counter() - start)
+        print(f"{calls} streamed answers: first token {statistics.median(first) * 1000:.1f} ms, "
+              f"full answer {statistics.median(total) * 1000:.1f} ms (median)")
+
+        before = server.connections
+        start = time.perf_counter()
+        for _ in range(calls):
+            ai_module.ask_ai(prompt)
+        print(f"{calls} calls, shared session: {time.perf_counter() - start:.2f}s, "
+              f"{server.connections - before} new connections")
+
+        before = server.connections
+        start = time.perf_counter()
+        for _ in range(calls):
+            with requests.post(f"{ai_module.OLLAMA_URL}/api/generate",
+                               json={"model": "llama3", "prompt": prompt},
+                               headers={"Connection": "close"}, stream=True, timeout=30) as resp:
+                "".join(json.loads(line)["response"] for line in resp.iter_lines() if line)
+        print(f"{calls} calls, new connection each: {time.perf_counter() - start:.2f}s, "
+              f"{server.connections - before} new connections")
+
+        # the old ask_ai started a process per prompt; this is the floor of that
+        # cost before any model loads
+        spawn = min(calls, 5)
+        start = time.perf_counter()
+        for _ in range(spawn):
+            subprocess.run(
+                [sys.executable, "-c", "import ai_module, sys; ai_module.ask_ai(sys.argv[1])", prompt],
+                env={**os.environ, "OLLAMA_URL": ai_module.OLLAMA_URL}, check=True,
+            )
+        per_call = (time.perf_counter() - start) / spawn
+        print(f"{spawn} calls, process per call: {per_call * calls:.2f}s for {calls} "
+              f"({per_call * 1000:.0f} ms each)")
+    server.shutdown()
+
+
+# --------------------------
+# CHAT ASSISTANT ROUTE ANSWERS
+# --------------------------
+CHAT_MESSAGES = ["Best route FRA to JFK", "Capacity from DEL to DXB",
+                 "anything from Singapore to Sydney?", "hello, how are you"]
+
+
+def chat_from_db(db, message):
+    """What /ai/chat did before the airport index: list scan, regex, SELECT."""
+    import re
+
+    msg = message.upper()
+    found = [ap for ap in AIRPORTS[:10] if ap in msg]
+    match = re.findall(r"\b[A-Z]{3}\b", msg)
+    if len(match) >= 2:
+        found = match
+    if len(found) >= 2:
+        return db.execute(
+            "SELECT * FROM flights WHERE origin=? AND destination=?", found[:2]
+        ).fetchall()
+
+
+def chat_from_index(index, message):
+    found = index.resolve(message)
+    if len(found) >= 2:
+        return index.route(*found[:2])
+
+
+def bench_chat(sizes):
+    import airports
+
+    for n in sizes:
+        db, path = make_db(n)
+        airports.invalidate()
+        start = time.perf_counter()
+        index = airports.get_index(db)
+        build = time.perf_counter() - start
+
+        old = timed(lambda: [chat_from_db(db, m) for m in CHAT_MESSAGES], 20) / len(CHAT_MESSAGES)
+        new = timed(lambda: [chat_from_index(index, m) for m in CHAT_MESSAGES], 2000) / len(CHAT_MESSAGES)
+        print(f"{n} flights: index built in {build:.2f}s, {len(index.routes)} routes; "
+              f"per message: database {old:.2f} ms, index {new * 1000:.1f} us ({old / new:.0f}x)")
+        db.close()
+        os.remove(path)
+
+
+# --------------------------
+# PAGINATED LISTS
+# --------------------------
+def bench_pages(sizes):
+    import storage
+
+    for n in sizes:
+        db, path = make_db(1000)
+        rng = random.Random(3)
+        db.executemany("""
+            INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight,
+                                  status, price, total)
+            VALUES (?, ?, 100, 100, 'CONFIRMED', 12, 1200)
+        """, ((rng.randint(1, 100), rng.randint(1, 1000)) for _ in range(n)))
+        db.commit()
+        repo = storage.Repository(db)
+        user = {"id": 1, "role": "forwarder", "company": None}
+        # a cursor halfway down the user's history
+        mine = db.execute("SELECT COUNT(*) FROM bookings WHERE user_id=1").fetchone()[0]
+        deep = db.execute(
+            "SELECT id FROM bookings WHERE user_id=1 ORDER BY id LIMIT 1 OFFSET ?", (mine // 2,)
+        ).fetchone()[0]
+
+        full = timed(lambda: db.execute("SELECT * FROM bookings").fetchall(), 3)
+        first = timed(lambda: repo.bookings(user), 200)
+        last = timed(lambda: repo.bookings(user, cursor=deep), 200)
+        print(f"{n} bookings: full list {full:.0f} ms; one user's page of "
+              f"{storage.PAGE_SIZE}: first {first:.3f} ms, page {mine // 2 // storage.PAGE_SIZE} {last:.3f} ms")
+        db.close()
+        os.remove(path)
+
+
+# --------------------------
+# INVOICES
+# --------------------------
+def bench_invoices(sizes):
+    import shutil
+    import invoices
+
+    for n in sizes:
+        rng = random.Random(5)
+        rows = []
+        for i, f in enumerate(synthetic_flights(n), 1):
+            weight = rng.randint(10, 500)
+            rows.append({
+                "id": i, "airline": f[0], "flight_no": f[1], "origin": f[2],
+                "destination": f[3], "date": f[4], "actual_weight": weight,
+                "volumetric_weight": weight * 0.8, "chargeable_weight": weight,
+                "price": 12, "total": weight * 12,
+            })
+
+        serial_dir, pool_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        start = time.perf_counter()
+        invoices.render_all(rows, workers=1, directory=serial_dir)
+        serial = time.perf_counter() - start
+        start = time.perf_counter()
+        invoices.render_all(rows, directory=pool_dir)
+        pooled = time.perf_counter() - start
+        start = time.perf_counter()
+        rendered, cached = invoices.render_all(rows, directory=pool_dir)
+        rerun = time.perf_counter() - start
+        print(f"{n} invoices: one process {serial:.2f}s, pool of {os.cpu_count()} {pooled:.2f}s; "
+              f"re-run {rerun:.2f}s ({rendered} rendered, {cached} cached)")
+
+        # streamed export of the cached invoices: peak memory vs archive size
+        import tracemalloc
+        invoices.INVOICE_DIR = pool_dir
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in invoices.stream_zip(rows))
+        export = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # what remains per invoice is its central directory entry (zipfile.ZipInfo)
+        print(f"  ZIP export: {size / 1e6:.1f} MB in {export:.2f}s, peak memory "
+              f"{peak / 1e6:.1f} MB ({peak / n:.0f} bytes per invoice)")
+        shutil.rmtree(serial_dir)
+        shutil.rmtree(pool_dir)
+
+
+# --------------------------
+# ROUTE MAP
+# --------------------------
+def all_routes_per_flight(db, coords):
+    """What /api/all_routes returned before: one arc per flight row."""
+    routes = []
+    for f in db.execute("SELECT origin, destination FROM flights"):
+        origin, dest = coords.get(f["origin"]), coords.get(f["destination"])
+        if origin and dest:
+            routes.append({"startLat": origin["latitude"], "startLng": origin["longitude"],
+                           "endLat": dest["latitude"], "endLng": dest["longitude"]})
+    return json.dumps(routes)
+
+
+def bench_map(sizes):
+    import airports
+
+    coords = airports.load_airports()
+    for n in sizes:
+        db, path = make_db(n)
+        utilization.rebuild(db)
+        db.commit()
+
+        old_body = all_routes_per_flight(db, coords)
+        old = timed(lambda: all_routes_per_flight(db, coords), 1)
+        airports.invalidate()
+        build = timed(lambda: airports.route_map(db), 1)
+        body, _ = airports.route_map(db)
+        cached = timed(lambda: airports.route_map(db), 1000)
+        print(f"{n} flights: per-flight arcs {old:.0f} ms, {len(old_body) / 1e6:.1f} MB; "
+              f"distinct routes built in {build:.0f} ms, {len(body) / 1e3:.0f} kB, "
+              f"cached {cached * 1000:.1f} us")
+        db.close()
+        os.remove(path)
+
+
+BENCHMARKS = {
+    "search": (bench_search, [10000, 100000, 1000000]),
+    "route": (bench_route, [1000000]),
+    "ingest": (bench_ingest, [1000000]),
+    "optimizer": (bench_optimizer, [100000]),
+    "expiry": (bench_expiry, [100000]),
+    "contention": (bench_contention, [32]),
+    "pool": (bench_pool, [16]),
+    "predict": (bench_predict, [10000]),
+    "startup": (bench_startup, [5]),
+    "llm": (bench_llm, [20]),
+    "chat": (bench_chat, [1000000]),
+    "pages": (bench_pages, [1000000]),
+    "invoices": (bench_invoices, [2000]),
+    "map": (bench_map, [1000000]),
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("usage: python benchmark.py {%s} [sizes...]" % "|".join(BENCHMARKS))
+        sys.exit(1)
+    fn, default_sizes = BENCHMARKS[sys.argv[1]]
+    fn([int(a) for a in sys.argv[2:]] or default_sizes)
@@ -1,19 +1,231 @@
+import os
+import queue
 import sqlite3
+import threading
 from flask import g
 
+import utilization
+
 DATABASE = "cargo.db"
 
+# "sqlite" (DATABASE) or "postgres" (DATABASE_URL); see storage.py
+BACKEND = os.environ.get("CARGO_DB_BACKEND", "sqlite")
+DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://localhost/cargo")
+
+# Bump when COLUMNS or INDEXES change so existing databases get migrated.
+SCHEMA_VERSION = 6
+
+# Columns added after the original CREATE TABLE statements. Older
+# databases are brought up to date by migrate().
+COLUMNS = {
+    "users": [
+        ("email", "TEXT"),
+        ("phone", "TEXT"),
+        ("company", "TEXT"),
+        ("profile_pic", "TEXT"),
+    ],
+    "flights": [
+        ("departure_time", "TEXT"),
+        ("arrival_time", "TEXT"),
+        ("duration_minutes", "INTEGER"),
+    ],
+    "bookings": [
+        ("actual_weight", "REAL"),
+        ("volumetric_weight", "REAL"),
+        ("chargeable_weight", "REAL"),
+        ("length", "REAL"),
+        ("width", "REAL"),
+        ("height", "REAL"),
+        ("confirmed_at", "INTEGER"),
+        ("penalty_paid", "REAL DEFAULT 0"),
+    ],
+    "booking_messages": [
+        ("receiver_id", "INTEGER"),
+        ("is_read", "INTEGER DEFAULT 0"),
+    ],
+}
+
+# Indexes backing the search, interline, chat, unread and booking queries,
+# and the (filter, id) keyset pagination of the booking and chat lists.
+INDEXES = {
+    "idx_flights_origin_date": "flights(origin, date)",
+    "idx_flights_destination_date": "flights(destination, date)",
+    "idx_flights_route_date_type": "flights(origin, destination, date, cargo_type)",
+    "idx_bookings_status_expires": "bookings(status, expires_at)",
+    "idx_bookings_flight": "bookings(flight_id)",
+    "idx_bookings_user": "bookings(user_id, id)",
+    "idx_booking_messages_page": "booking_messages(booking_id, id)",
+    "idx_booking_messages_unread": "booking_messages(receiver_id, is_read)",
+}
+
+# Indexes earlier schema versions created and migrate() drops. Only these
+# names are removed, never indexes added by hand.
+RETIRED_INDEXES = [
+    "idx_booking_messages_booking",   # replaced by idx_booking_messages_page (v6)
+]
+
+# A flight is identified by its natural key; re-uploads update it in place.
+NATURAL_KEY = ("airline", "flight_no", "date", "origin", "destination")
+UNIQUE_INDEXES = {
+    "idx_flights_natural_key": f"flights({', '.join(NATURAL_KEY)})",
+}
+
+FLIGHT_COLUMNS = [
+    "airline", "flight_no", "origin", "destination", "date",
+    "capacity", "cargo_type", "departure_time", "arrival_time", "duration_minutes"
+]
+
+# Weight currently held against a flight (HOLD or CONFIRMED bookings).
+BOOKED_WEIGHT_SQL = """
+    SELECT COALESCE(SUM(weight), 0) FROM bookings
+    WHERE flight_id = {flight_id} AND status IN ('HOLD', 'CONFIRMED')
+"""
+
+# flights.capacity is what is left to sell, so an upload that republishes
+# a flight's capacity keeps the weight already booked on it subtracted.
+UPSERT_FLIGHT_SQL = f"""
+    INSERT INTO flights ({", ".join(FLIGHT_COLUMNS)})
+    VALUES ({", ".join("?" * len(FLIGHT_COLUMNS))})
+    ON CONFLICT ({", ".join(NATURAL_KEY)}) DO UPDATE SET
+        cargo_type = excluded.cargo_type,
+        departure_time = COALESCE(excluded.departure_time, flights.departure_time),
+        arrival_time = COALESCE(excluded.arrival_time, flights.arrival_time),
+        duration_minutes = COALESCE(excluded.duration_minutes, flights.duration_minutes),
+        capacity = excluded.capacity - ({BOOKED_WEIGHT_SQL.format(flight_id="flights.id")})
+"""
+
+
+# --------------------------
+# CONNECTION POOL
+# --------------------------
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+POOL_TIMEOUT = 30          # seconds a request waits for a free connection
+STATEMENT_CACHE = 256      # prepared statements kept per connection
+
+# Applied to every pooled connection. WAL lets readers run while a writer
+# commits; busy_timeout makes writers queue instead of failing straight away.
+PRAGMAS = {
+    "busy_timeout": 5000,               # ms
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,     # bytes
+    "cache_size": -32000,               # KiB (negative = size, not pages)
+    "temp_store": "MEMORY",
+}
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """
+    At most `size` connections to one database file, opened on demand and
+    handed out LIFO so the warmest connection (page cache, prepared
+    statements) is reused first.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        # a pooled connection moves between request threads, one at a time
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE
+        )
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self, timeout=POOL_TIMEOUT):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return self.connect()
+                except Exception:
+                    self.opened -= 1
+                    raise
+        try:
+            return self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"no free database connection after {timeout}s")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            # a request that failed halfway must not leak its writes
+            conn.rollback()
+        self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.opened -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    """
+    One pool per database and process (pools do not survive fork). path is
+    a file name for SQLite and a connection URL for PostgreSQL.
+    """
+    if BACKEND == "postgres":
+        from storage import PostgresPool as pool_class
+        path = path or DATABASE_URL
+    else:
+        pool_class = ConnectionPool
+        path = path or DATABASE
+
+    key = (os.getpid(), BACKEND, path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = pool_class(path)
+        return _pools[key]
+
+
+def connect(path=None):
+    """A standalone connection for background jobs and scripts."""
+    return get_pool(path).connect()
+
 
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        g._database_pool = get_pool()
+        db = g._database = g._database_pool.acquire()
     return db
 
 
-def init_db():
-    db = sqlite3.connect(DATABASE)
+def close_db(exception=None):
+    """Return the request's connection to its pool (teardown_appcontext)."""
+    db = g.pop("_database", None)
+    if db is not None:
+        g.pop("_database_pool").release(db)
+
+
+def init_db(path=None):
+    if BACKEND == "postgres":
+        from storage import init_postgres
+        init_postgres(path)
+        return
+
+    db = sqlite3.connect(path or DATABASE)
 
     db.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -59,5 +271,171 @@ def init_db():
         )
     """)
 
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS booking_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER,
+            sender_id INTEGER,
+            message TEXT,
+            timestamp TEXT
+        )
+    """)
+
+    # validators from the last airline feed sync (see feed_sync.py)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS feed_state (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            synced_at INTEGER
+        )
+    """)
+
+    utilization.create_table(db)
+
+    migrate(db)
+
     db.commit()
     db.close()
+
+
+# --------------------------
+# SCHEMA MIGRATIONS
+# --------------------------
+def table_columns(db, table):
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+
+
+def migrate(db):
+    """
+    Bring an existing database up to SCHEMA_VERSION: add missing columns,
+    create the search indexes and drop the RETIRED_INDEXES.
+    Safe to run on every start.
+    """
+    for table, columns in COLUMNS.items():
+        existing = table_columns(db, table)
+        for name, decl in columns:
+            if name not in existing:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+    for name in RETIRED_INDEXES:
+        db.execute(f"DROP INDEX IF EXISTS {name}")
+
+    for name, target in INDEXES.items():
+        db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    rebuild_utilization = version < 4
+
+    for name, target in UNIQUE_INDEXES.items():
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (name,)
+        ).fetchone()
+        if not exists:
+            # existing duplicates would make the unique index fail
+            if compact_flights(db):
+                rebuild_utilization = True
+            db.execute(f"CREATE UNIQUE INDEX {name} ON {target}")
+
+    if rebuild_utilization:
+        utilization.rebuild(db)
+
+    if version < SCHEMA_VERSION:
+        # refresh planner statistics once per schema change
+        db.execute("ANALYZE")
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    db.commit()
+
+
+# --------------------------
+# FLIGHT DEDUPLICATION
+# --------------------------
+def compact_flights(db):
+    """
+    Merge duplicate flights (same natural key) in place. The oldest row
+    keeps its id so bookings and invoices stay valid, takes the schedule of
+    the most recent upload, and bookings on the removed copies are moved
+    onto it. Returns the number of rows deleted.
+    """
+    key = ", ".join(NATURAL_KEY)
+    not_null = " AND ".join(f"{c} IS NOT NULL" for c in NATURAL_KEY)
+
+    db.execute("DROP TABLE IF EXISTS temp.flight_dupes")
+    db.execute(f"""
+        CREATE TEMP TABLE flight_dupes AS
+        SELECT f.id AS id, g.keep_id AS keep_id, g.latest_id AS latest_id
+        FROM flights f
+        JOIN (
+            SELECT {key}, MIN(id) AS keep_id, MAX(id) AS latest_id
+            FROM flights
+            WHERE {not_null}
+            GROUP BY {key}
+            HAVING COUNT(*) > 1
+        ) g USING ({key})
+    """)
+    db.execute("CREATE INDEX temp.idx_flight_dupes ON flight_dupes(id)")
+
+    # capacity the latest copy was published with, before its bookings
+    db.execute("DROP TABLE IF EXISTS temp.flight_keep")
+    db.execute(f"""
+        CREATE TEMP TABLE flight_keep AS
+        SELECT DISTINCT d.keep_id AS keep_id, d.latest_id AS latest_id,
+               f.capacity + ({BOOKED_WEIGHT_SQL.format(flight_id="d.latest_id")}) AS published
+        FROM flight_dupes d JOIN flights f ON f.id = d.latest_id
+    """)
+
+    db.execute("""
+        UPDATE bookings
+        SET flight_id = (SELECT keep_id FROM flight_dupes WHERE id = bookings.flight_id)
+        WHERE flight_id IN (SELECT id FROM flight_dupes WHERE id != keep_id)
+    """)
+
+    db.execute(f"""
+        UPDATE flights
+        SET (cargo_type, departure_time, arrival_time, duration_minutes, capacity) = (
+            SELECT l.cargo_type,
+                   COALESCE(l.departure_time, flights.departure_time),
+                   COALESCE(l.arrival_time, flights.arrival_time),
+                   COALESCE(l.duration_minutes, flights.duration_minutes),
+                   k.published - ({BOOKED_WEIGHT_SQL.format(flight_id="flights.id")})
+            FROM flight_keep k JOIN flights l ON l.id = k.latest_id
+            WHERE k.keep_id = flights.id
+        )
+        WHERE id IN (SELECT keep_id FROM flight_keep)
+    """)
+
+    deleted = db.execute(
+        "DELETE FROM flights WHERE id IN (SELECT id FROM flight_dupes WHERE id != keep_id)"
+    ).rowcount
+
+    db.execute("DROP TABLE temp.flight_dupes")
+    db.execute("DROP TABLE temp.flight_keep")
+    db.commit()
+    return deleted
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["compact"]:
+        if BACKEND != "sqlite":
+            # init_postgres creates idx_flights_natural_key up front, so
+            # Postgres never holds duplicate flights to merge
+            print(f"compact only applies to SQLite (CARGO_DB_BACKEND={BACKEND})")
+            sys.exit(1)
+        init_db()
+        conn = connect()
+        removed = compact_flights(conn)
+        if removed:
+            utilization.rebuild(conn)
+            conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        print(f"Removed {removed} duplicate flights from {DATABASE}")
+    elif sys.argv[1:] == ["init"]:
+        init_db()
+        print(f"Initialized {DATABASE_URL if BACKEND == 'postgres' else DATABASE}")
+    else:
+        print("usage: python database.py {init|compact}")
+        sys.exit(1)
@@ -0,0 +1,198 @@
+# feed_sync.py
+# Concurrent airline feed import with conditional requests and bulk upserts.
+#
+#   python feed_sync.py                # sync once
+#   python feed_sync.py --every 300    # keep syncing every 5 minutes
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import routing
+import airports
+import utilization
+import reservations
+from database import UPSERT_FLIGHT_SQL
+
+FEED_BASE_URL = os.environ.get("FEED_BASE_URL", "http://127.0.0.1:5000")
+
+SOURCES = [
+    f"{FEED_BASE_URL}/api/emirates",
+    f"{FEED_BASE_URL}/api/qatar",
+    f"{FEED_BASE_URL}/api/lufthansa",
+    f"{FEED_BASE_URL}/api/klm",
+    f"{FEED_BASE_URL}/api/british_airways",
+]
+
+TIMEOUT = (3.05, 10)   # connect, read (seconds)
+RETRIES = 3
+MAX_WORKERS = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared keep-alive session with retries on connection errors and 5xx."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is imported on first sync, not when app.py starts
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=RETRIES,
+                backoff_factor=0.3,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=("GET",),
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=MAX_WORKERS)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+# --------------------------
+# FETCH
+# --------------------------
+def fetch_feed(session, url, etag=None, last_modified=None):
+    """
+    GET one feed, sending the validators from the previous sync.
+    Returns (status, flights, etag, last_modified); flights is None when
+    the feed answered 304 Not Modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    resp = session.get(url, headers=headers, timeout=TIMEOUT)
+    if resp.status_code == 304:
+        return 304, None, etag, last_modified
+    resp.raise_for_status()
+    return (
+        resp.status_code,
+        resp.json(),
+        resp.headers.get("ETag"),
+        resp.headers.get("Last-Modified"),
+    )
+
+
+def feed_rows(feed):
+    return [
+        (f["airline"], f["flight_no"], f["origin"].upper(), f["destination"].upper(),
+         f["date"], f["capacity"], f.get("cargo_type") or "General",
+         f.get("departure_time"), f.get("arrival_time"), f.get("duration_minutes"))
+        for f in feed
+    ]
+
+
+# --------------------------
+# SYNC
+# --------------------------
+def sync_feeds(db, sources=None, session=None):
+    """
+    Fetch every source concurrently, skip feeds that have not changed since
+    the last sync and upsert the rest in one transaction.
+    Returns {url: {"status": ..., "rows": ...}}.
+    """
+    import requests
+
+    sources = sources or SOURCES
+    session = session or get_session()
+
+    state = {
+        row[0]: (row[1], row[2])
+        for row in db.execute("SELECT url, etag, last_modified FROM feed_state")
+    }
+
+    def fetch(url):
+        etag, last_modified = state.get(url, (None, None))
+        try:
+            return url, fetch_feed(session, url, etag, last_modified), None
+        except (requests.RequestException, ValueError) as e:
+            return url, None, e
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(sources))) as pool:
+        fetched = list(pool.map(fetch, sources))
+
+    report = {}
+    now = int(time.time())
+    # one transaction for every feed: on Postgres (autocommit) each statement
+    # would otherwise commit by itself and a failed sync would leave half a feed
+    with reservations.write_transaction(db):
+        for url, result, error in fetched:
+            if error is not None:
+                report[url] = {"status": "error", "rows": 0, "error": str(error)}
+                continue
+
+            status, feed, etag, last_modified = result
+            if feed is None:
+                report[url] = {"status": "not_modified", "rows": 0}
+                continue
+
+            rows = feed_rows(feed)
+            db.executemany(UPSERT_FLIGHT_SQL, rows)
+            utilization.refresh_routes(db, [(r[2], r[3], r[4]) for r in rows])
+            db.execute("""
+                INSERT INTO feed_state (url, etag, last_modified, synced_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    synced_at = excluded.synced_at
+            """, (url, etag, last_modified, now))
+            report[url] = {"status": "updated", "rows": len(rows)}
+
+    if any(r["status"] == "updated" for r in report.values()):
+        # upserts change flights in place, which the caches' data key misses
+        routing.invalidate()
+        airports.invalidate()
+    return report
+
+
+# --------------------------
+# BACKGROUND JOB
+# --------------------------
+def run_forever(interval, sources=None, stop_event=None):
+    stop_event = stop_event or threading.Event()
+    db = database.connect()
+    try:
+        while not stop_event.is_set():
+            try:
+                report = sync_feeds(db, sources)
+                print("feed sync:", {u: r["status"] for u, r in report.items()})
+            except Exception as e:   # sqlite3 or psycopg errors
+                print("feed sync failed:", e)
+            stop_event.wait(interval)
+    finally:
+        db.close()
+
+
+def start_background_sync(interval=300, sources=None):
+    """Sync feeds on a daemon thread; set the returned event to stop it."""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_forever, args=(interval, sources, stop_event),
+        name="feed-sync", daemon=True
+    )
+    thread.start()
+    return stop_event
+
+
+if __name__ == "__main__":
+    database.init_db()
+    if len(sys.argv) == 3 and sys.argv[1] == "--every":
+        run_forever(int(sys.argv[2]))
+    else:
+        conn = database.connect()
+        for url, result in sync_feeds(conn).items():
+            print(f"{result['status']:>12} {result['rows']:>6}  {url}")
+        conn.close()
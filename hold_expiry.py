@@ -0,0 +1,160 @@
+# hold_expiry.py
+# Background worker that cancels HOLD bookings when their hold runs out and
+# gives the weight back to the flight.
+
+import os
+import time
+import heapq
+import threading
+
+import database
+import reservations
+
+BATCH_SIZE = 500        # holds released per transaction
+SWEEP_INTERVAL = 30     # seconds between DB sweeps for holds made elsewhere
+
+
+def expire_holds(db, booking_ids, now=None):
+    """
+    Cancel the given bookings that are still on an expired HOLD and restore
+    their flights' capacity, all in one write transaction. Returns the
+    expired (booking_id, expires_at) pairs.
+    """
+    now = int(time.time()) if now is None else now
+    if not booking_ids:
+        return []
+
+    placeholders = ",".join("?" * len(booking_ids))
+    with reservations.write_transaction(db):
+        rows = db.execute(f"""
+            SELECT id, expires_at FROM bookings
+            WHERE id IN ({placeholders}) AND status='HOLD' AND expires_at < ?
+        """, (*booking_ids, now)).fetchall()
+        for booking_id, _ in rows:
+            reservations.release(db, booking_id, "HOLD", "CANCELLED")
+    return [tuple(r) for r in rows]
+
+
+def due_holds(db, now=None, limit=BATCH_SIZE):
+    now = int(time.time()) if now is None else now
+    return [r[0] for r in db.execute(
+        "SELECT id FROM bookings WHERE status='HOLD' AND expires_at < ? LIMIT ?",
+        (now, limit)
+    )]
+
+
+class HoldExpiryWorker:
+    """
+    Keeps a min-heap of (expires_at, booking_id) and sleeps until the
+    earliest hold is due, then releases everything due in batches. A slow
+    periodic sweep picks up holds created by other processes.
+    """
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE, sweep_interval=SWEEP_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self.heap = []
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.pid = os.getpid()
+        self.stats = {"expired": 0, "batches": 0, "max_delay": 0.0}
+
+    def start(self):
+        db = database.connect(self.path)
+        try:
+            pending = [tuple(r) for r in db.execute(
+                "SELECT expires_at, id FROM bookings WHERE status='HOLD'"
+            )]
+        finally:
+            db.close()
+        with self.cond:
+            self.heap.extend(pending)
+            heapq.heapify(self.heap)
+
+        self.thread = threading.Thread(target=self._run, name="hold-expiry", daemon=True)
+        self.thread.start()
+        return self
+
+    def schedule(self, booking_id, expires_at):
+        with self.cond:
+            heapq.heappush(self.heap, (expires_at, booking_id))
+            if self.heap[0][1] == booking_id:
+                self.cond.notify()
+
+    def stop(self, timeout=None):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _next_batch(self, next_sweep):
+        with self.cond:
+            while not self.stopped:
+                now = time.time()
+                # a hold expiring at T is still valid during second T
+                due_at = self.heap[0][0] + 1 if self.heap else float("inf")
+                wait = min(due_at, next_sweep) - now
+                if wait <= 0:
+                    break
+                self.cond.wait(wait)
+
+            now = int(time.time())
+            batch = []
+            while self.heap and self.heap[0][0] < now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self.heap)[1])
+            return batch
+
+    def _release(self, db, booking_ids):
+        expired = expire_holds(db, booking_ids)
+        now = time.time()
+        self.stats["batches"] += 1
+        self.stats["expired"] += len(expired)
+        for _, expires_at in expired:
+            self.stats["max_delay"] = max(self.stats["max_delay"], now - (expires_at + 1))
+
+    def _run(self):
+        db = database.connect(self.path)
+        next_sweep = time.time() + self.sweep_interval
+        try:
+            while True:
+                batch = self._next_batch(next_sweep)
+                if self.stopped:
+                    break
+                try:
+                    if batch:
+                        self._release(db, batch)
+                    if time.time() >= next_sweep:
+                        while True:
+                            ids = due_holds(db, limit=self.batch_size)
+                            if not ids:
+                                break
+                            self._release(db, ids)
+                        next_sweep = time.time() + self.sweep_interval
+                except Exception as e:   # sqlite3 or psycopg errors
+                    print("hold expiry failed:", e)
+                    time.sleep(1)
+        finally:
+            db.close()
+
+
+# --------------------------
+# PROCESS-WIDE WORKER
+# --------------------------
+_worker = None
+_lock = threading.Lock()
+
+
+def get_worker(path=None):
+    """Start the worker once per process (safe to call from every request)."""
+    global _worker
+    with _lock:
+        if _worker is None or _worker.pid != os.getpid():
+            _worker = HoldExpiryWorker(path).start()
+        return _worker
+
+
+def schedule(booking_id, expires_at):
+    get_worker().schedule(booking_id, expires_at)
@@ -0,0 +1,184 @@
+# ingest.py
+# Streaming bulk import of flight schedules from CSV, Excel and XML files.
+# pandas is imported by the functions that need it, so importing this module
+# (which app.py does at startup) stays cheap.
+
+import os
+import time
+import sqlite3
+import xml.etree.ElementTree as ET
+
+import database
+import utilization
+from database import FLIGHT_COLUMNS, UPSERT_FLIGHT_SQL
+
+CHUNK_SIZE = 50000
+
+# Files bigger than this load faster by dropping the flights indexes and
+# rebuilding them once at the end instead of updating them row by row.
+REBUILD_INDEXES_BYTES = 16 * 1024 * 1024
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".xml", ".xlm")
+
+
+# --------------------------
+# READERS (one DataFrame per chunk)
+# --------------------------
+def read_csv_chunks(path, chunksize):
+    import pandas as pd
+
+    yield from pd.read_csv(path, chunksize=chunksize, dtype=str, skipinitialspace=True)
+
+
+def read_xlsx_chunks(path, chunksize):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h).strip() for h in next(rows, ())]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        wb.close()
+
+
+def read_xml_chunks(path, chunksize):
+    """<flights><flight><airline>..</airline>..</flight></flights>"""
+    import pandas as pd
+
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    chunk = []
+    for event, elem in context:
+        if event == "end" and elem.tag == "flight":
+            chunk.append({child.tag: child.text for child in elem})
+            root.clear()  # drop parsed elements so memory stays flat
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk)
+                chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk)
+
+
+READERS = {
+    ".csv": read_csv_chunks,
+    ".xlsx": read_xlsx_chunks,
+    ".xml": read_xml_chunks,
+    ".xlm": read_xml_chunks,
+}
+
+
+def read_chunks(path, chunksize=CHUNK_SIZE):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Unsupported file type: {ext}")
+    return READERS[ext](path, chunksize)
+
+
+# --------------------------
+# NORMALIZATION (vectorized)
+# --------------------------
+def _text(col):
+    return col.astype("string").str.strip()
+
+
+def normalize(df):
+    """
+    Same cleanup as insert_flight, applied to a whole chunk: trimmed text,
+    upper-case airport codes, integer capacity and YYYY-MM-DD dates.
+    """
+    import pandas as pd
+
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    for col in FLIGHT_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df = df[FLIGHT_COLUMNS].copy()
+
+    for col in ("airline", "flight_no", "departure_time", "arrival_time"):
+        df[col] = _text(df[col])
+    df["origin"] = _text(df["origin"]).str.upper()
+    df["destination"] = _text(df["destination"]).str.upper()
+    df["cargo_type"] = _text(df["cargo_type"]).replace("", pd.NA).fillna("General")
+
+    if pd.api.types.is_datetime64_any_dtype(df["date"]):
+        df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+    df["date"] = (
+        _text(df["date"])
+        .str.replace("/", "-", regex=False)
+        .str.replace(r"^(\d{2})-(\d{2})-(\d{4})$", r"\3-\2-\1", regex=True)
+        .str.replace(r"^(\d{4}-\d{2}-\d{2})[ T].*$", r"\1", regex=True)
+    )
+
+    df["capacity"] = pd.to_numeric(df["capacity"], errors="coerce").fillna(0).astype("int64")
+    df["duration_minutes"] = pd.to_numeric(df["duration_minutes"], errors="coerce").astype("Int64")
+
+    return df.astype(object).where(df.notna(), None)
+
+
+# --------------------------
+# BULK LOAD
+# --------------------------
+def load_file(db, path, chunksize=CHUNK_SIZE):
+    """
+    Stream a schedule file into flights with one executemany per chunk,
+    all inside a single transaction. Rows are upserted on the flight's
+    natural key, so re-uploading a file is idempotent. Returns row count
+    and throughput.
+    """
+    start = time.perf_counter()
+    rows = 0
+    routes = set()
+    flight_indexes = {
+        name: target for name, target in database.INDEXES.items()
+        if target.startswith("flights(")
+    }
+    rebuild = os.path.getsize(path) > REBUILD_INDEXES_BYTES
+
+    # durability is relaxed for the load on SQLite only
+    sqlite = isinstance(db, sqlite3.Connection)
+    if sqlite:
+        previous_sync = db.execute("PRAGMA synchronous").fetchone()[0]
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=OFF")
+    try:
+        if not db.in_transaction:
+            db.execute("BEGIN")
+        if rebuild:
+            for name in flight_indexes:
+                db.execute(f"DROP INDEX IF EXISTS {name}")
+        for chunk in read_chunks(path, chunksize):
+            chunk = normalize(chunk)
+            db.executemany(UPSERT_FLIGHT_SQL, chunk.itertuples(index=False, name=None))
+            rows += len(chunk)
+            routes.update(
+                chunk[["origin", "destination", "date"]]
+                .drop_duplicates()
+                .itertuples(index=False, name=None)
+            )
+        if rebuild:
+            for name, target in flight_indexes.items():
+                db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        utilization.refresh_routes(db, routes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if sqlite:
+            db.execute(f"PRAGMA synchronous={previous_sync}")
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 2),
+        "rows_per_sec": int(rows / seconds) if seconds else rows
+    }
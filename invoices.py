@@ -0,0 +1,233 @@
+# invoices.py
+# Invoice PDFs, rendered once per version of a booking. The file name carries
+# a hash of everything printed on the invoice (booking and flight fields plus
+# LAYOUT_VERSION), so an unchanged booking is served straight from disk with
+# that hash as its ETag, and a changed booking gets a new file.
+#
+#   CARGO_INVOICE_DIR=invoices
+#   python invoices.py bulk [--from 2025-12-01] [--to 2025-12-31] [--workers 8]
+
+import os
+import glob
+import json
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+INVOICE_DIR = os.environ.get(
+    "CARGO_INVOICE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "invoices")
+)
+LAYOUT_VERSION = 1     # bump when draw() changes so every invoice is redrawn
+BULK_CHUNK = 64        # invoices per process-pool task
+
+# booking id, then the flight and booking fields the invoice prints
+FIELDS = ("id", "airline", "flight_no", "origin", "destination", "date",
+          "actual_weight", "volumetric_weight", "chargeable_weight", "price", "total")
+
+
+def invoice_data(row):
+    """The printed fields of a booking joined with its flight (Repository.invoice_row)."""
+    return {name: row[name] for name in FIELDS}
+
+
+def invoice_key(data):
+    blob = json.dumps([LAYOUT_VERSION, data], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def invoice_path(data, key, directory=None):
+    return os.path.join(directory or INVOICE_DIR, f"invoice_{data['id']}_{key[:16]}.pdf")
+
+
+# --------------------------
+# RENDERING
+# --------------------------
+def draw(c, data):
+    """One invoice page on a reportlab canvas."""
+    c.setFont("Helvetica", 12)
+
+    c.drawString(40, 800, "CARGO AIRWAY BILL / INVOICE")
+    c.drawString(40, 780, f"Invoice #: {data['id']}")
+    c.drawString(40, 760, f"Flight: {data['airline']} {data['flight_no']}")
+    c.drawString(40, 740, f"Route: {data['origin']} → {data['destination']}")
+    c.drawString(40, 720, f"Date: {data['date']}")
+
+    c.drawString(40, 690, f"Actual Weight: {data['actual_weight'] or 0} kg")
+    c.drawString(40, 670, f"Volumetric Weight: {data['volumetric_weight'] or 0:.2f} kg")
+    c.drawString(40, 650, f"Chargeable Weight: {data['chargeable_weight'] or 0:.2f} kg")
+
+    c.drawString(40, 620, f"Rate per kg: ₹{data['price']}")
+    c.drawString(40, 600, f"Total Amount: ₹{data['total'] or 0:.2f}")
+
+    c.drawString(40, 560, "Thank you for choosing Cargo Network Portal!")
+
+
+def render(data, path):
+    """
+    Write the PDF next to its final name and rename it into place, so a
+    reader never sees a half-written file. Older versions of the same
+    invoice are removed.
+    """
+    from reportlab.pdfgen import canvas   # not imported at startup
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    c = canvas.Canvas(tmp)
+    draw(c, data)
+    c.save()
+    os.replace(tmp, path)
+
+    pattern = os.path.join(os.path.dirname(path), f"invoice_{data['id']}_*.pdf")
+    for old in glob.glob(pattern):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+def _render_missing(data, key, directory=None):
+    path = invoice_path(data, key, directory)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        render(data, path)
+    return path
+
+
+def ensure(data, directory=None):
+    """(path, key) of the invoice, rendering it only if this version is missing."""
+    key = invoice_key(data)
+    pending = _pending.get(key)
+    if pending is not None:
+        pending.result()   # already being rendered in the background
+    return _render_missing(data, key, directory), key
+
+
+# --------------------------
+# BACKGROUND RENDERING
+# --------------------------
+_executor = None
+_executor_pid = None
+_pending = {}          # invoice key -> future
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(1, thread_name_prefix="invoice")
+            _executor_pid = os.getpid()
+            _pending.clear()
+        return _executor
+
+
+def submit(data):
+    """
+    Render the invoice off the request thread (after a booking is
+    confirmed), so the first download is already cached.
+    """
+    executor = get_executor()
+    key = invoice_key(data)
+    with _lock:
+        if key in _pending:
+            return _pending[key]
+        future = _pending[key] = executor.submit(_render_missing, data, key)
+    future.add_done_callback(lambda _: _pending.pop(key, None))
+    return future
+
+
+# --------------------------
+# BULK (month-end billing)
+# --------------------------
+def _render_chunk(chunk, directory):
+    for data in chunk:
+        path = invoice_path(data, invoice_key(data), directory)
+        render(data, path)
+    return len(chunk)
+
+
+def render_all(rows, workers=None, directory=None):
+    """
+    Render every invoice that is missing or out of date, spread over a
+    process pool. Returns (rendered, already cached).
+    """
+    directory = directory or INVOICE_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    todo, cached = [], 0
+    for row in rows:
+        data = invoice_data(row)
+        if os.path.exists(invoice_path(data, invoice_key(data), directory)):
+            cached += 1
+        else:
+            todo.append(data)
+
+    chunks = [todo[i:i + BULK_CHUNK] for i in range(0, len(todo), BULK_CHUNK)]
+    if workers == 1 or len(chunks) <= 1:
+        rendered = sum(_render_chunk(chunk, directory) for chunk in chunks)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            rendered = sum(pool.map(_render_chunk, chunks, [directory] * len(chunks)))
+    return rendered, cached
+
+
+# --------------------------
+# EXPORT (streamed ZIP)
+# --------------------------
+class _Sink:
+    """Write-only file for zipfile that hands over what was written so far."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(rows):
+    """
+    ZIP of the invoices for rows (Repository.invoice_page rows), yielded as
+    it is written. Each invoice is taken from the cache, or rendered, only
+    when the archive reaches it, so at most one PDF is held in memory.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for row in rows:
+            data = invoice_data(row)
+            path, _ = ensure(data)
+            archive.write(path, f"invoice_{data['id']}.pdf")
+            yield sink.take()
+    yield sink.take()   # the central directory, written on close
+
+
+if __name__ == "__main__":
+    import argparse
+    import database
+    import storage
+
+    parser = argparse.ArgumentParser(description="Render invoices for confirmed bookings.")
+    parser.add_argument("command", choices=["bulk"])
+    parser.add_argument("--from", dest="date_from", help="first flight date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="last flight date, YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPUs)")
+    args = parser.parse_args()
+
+    conn = database.connect()
+    try:
+        repo = storage.REPOSITORIES[database.BACKEND](conn)
+        rows = repo.invoice_rows(args.date_from, args.date_to)
+    finally:
+        conn.close()
+    rendered, cached = render_all(rows, args.workers)
+    print(f"{rendered} invoices rendered, {cached} already up to date in {INVOICE_DIR}")
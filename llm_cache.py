@@ -0,0 +1,170 @@
+# llm_cache.py
+# Persistent cache of LLM answers. The ai_module prompts are fixed templates,
+# so cargo_risk("Pharma") or analyze_route() for the same two flights asks
+# the same question every time. Answers are kept in their own SQLite file,
+# keyed by model + a hash of the whitespace-normalized prompt. The file sits
+# in the app directory (beside cargo.db), not in whatever directory the server
+# was started from.
+#
+#   LLM_CACHE_PATH=llm_cache.db LLM_CACHE_TTL=604800 LLM_CACHE_SIZE=5000
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import database
+
+CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.db")
+)
+TTL = float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))   # seconds, 0 = never expire
+MAX_ENTRIES = int(os.environ.get("LLM_CACHE_SIZE", 5000))      # 0 disables the cache
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used);
+"""
+
+
+def normalize(prompt):
+    """Templates differ only in indentation and line breaks; ignore those."""
+    return " ".join(prompt.split())
+
+
+def cache_key(model, prompt):
+    return hashlib.sha256(f"{model}\0{normalize(prompt)}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    LRU by last use, capped at max_entries rows, with entries older than ttl
+    treated as misses. Cache errors never fail the LLM call: they count as
+    a miss and the answer is generated as usual.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pool = database.ConnectionPool(path, size=4)
+        self.ready = False
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = self.errors = 0
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.acquire()
+        try:
+            if not self.ready:
+                conn.executescript(SCHEMA)
+                self.ready = True
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    def count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def get(self, model, prompt):
+        if self.max_entries <= 0:
+            return None
+        key, now = cache_key(model, prompt), time.time()
+        try:
+            with self.connection() as db:
+                row = db.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key=?", (key,)
+                ).fetchone()
+                if row is not None and self.ttl and now - row["created_at"] > self.ttl:
+                    db.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                    db.commit()
+                    self.count(expired=1)
+                    row = None
+                if row is None:
+                    self.count(misses=1)
+                    return None
+                db.execute("UPDATE llm_cache SET last_used=? WHERE key=?", (now, key))
+                db.commit()
+        except sqlite3.Error as e:
+            print("llm cache read failed:", e)
+            self.count(misses=1, errors=1)
+            return None
+        self.count(hits=1)
+        return row["response"]
+
+    def put(self, model, prompt, response):
+        if self.max_entries <= 0 or not response:
+            return
+        now = time.time()
+        try:
+            with self.connection() as db:
+                db.execute("""
+                    INSERT INTO llm_cache (key, model, response, created_at, last_used)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        response = excluded.response,
+                        created_at = excluded.created_at,
+                        last_used = excluded.last_used
+                """, (cache_key(model, prompt), model, response, now, now))
+                excess = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    db.execute("""
+                        DELETE FROM llm_cache WHERE key IN (
+                            SELECT key FROM llm_cache ORDER BY last_used LIMIT ?
+                        )
+                    """, (excess,))
+                    self.count(evictions=excess)
+                db.commit()
+        except sqlite3.Error as e:
+            print("llm cache write failed:", e)
+            self.count(errors=1)
+
+    def cached(self, model, prompt, generate):
+        """The stored answer, or generate() it and store the result."""
+        response = self.get(model, prompt)
+        if response is None:
+            response = generate()
+            self.put(model, prompt, response)
+        return response
+
+    def clear(self):
+        with self.connection() as db:
+            db.execute("DELETE FROM llm_cache")
+            db.commit()
+        with self.lock:
+            self.hits = self.misses = self.evictions = self.expired = self.errors = 0
+
+    def stats(self):
+        try:
+            with self.connection() as db:
+                entries = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "errors": self.errors,
+            }
+
+
+cache = LLMCache()
@@ -2,56 +2,85 @@
 import os
 import threading
 import time
+from importlib.util import find_spec
 
-# Try GPT4All local model first
-try:
-    from gpt4all import GPT4All
-    GPT4ALL_AVAILABLE = True
-except Exception:
-    GPT4ALL_AVAILABLE = False
+import llm_cache
+import llm_slots
 
-# OpenAI fallback
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
+# Backends are only imported when a prompt needs them: importing gpt4all or
+# openai is slow, and the local model can be several GB.
+GPT4ALL_AVAILABLE = find_spec("gpt4all") is not None
+OPENAI_AVAILABLE = find_spec("openai") is not None
 
 # configure model path (if using local)
 LOCAL_MODEL_PATH = os.environ.get("GPT4ALL_MODEL_PATH", "models/gpt4all-model.bin")
 
 gpt4all_bot = None
-if GPT4ALL_AVAILABLE and os.path.exists(LOCAL_MODEL_PATH):
-    gpt4all_bot = GPT4All(model=LOCAL_MODEL_PATH)
+_gpt4all_lock = threading.Lock()
+_warm_pid = None
+_warm_lock = threading.Lock()
+# GPT4All is not thread-safe: one generate() at a time per process
+_generate_lock = threading.Lock()
+
+def load_gpt4all():
+    """Load the local model once, on first use (or from warm_up)."""
+    global gpt4all_bot
+    with _gpt4all_lock:
+        if gpt4all_bot is None and GPT4ALL_AVAILABLE and os.path.exists(LOCAL_MODEL_PATH):
+            from gpt4all import GPT4All
+            gpt4all_bot = GPT4All(model=LOCAL_MODEL_PATH)
+    return gpt4all_bot
+
+def warm_up():
+    """
+    Start loading the local model on a background thread, once per process.
+    Called in each server worker after the fork, never in the master: the
+    model's native threads would not be copied into the workers.
+    """
+    global _warm_pid
+    with _warm_lock:
+        if _warm_pid == os.getpid():
+            return
+        _warm_pid = os.getpid()
+    threading.Thread(target=load_gpt4all, name="gpt4all-load", daemon=True).start()
 
 def ask_local_gpt4all(prompt, max_tokens=256):
-    if not gpt4all_bot:
+    bot = load_gpt4all()
+    if not bot:
         raise RuntimeError("Local GPT4All model not available.")
     # simple synchronous generate
-    resp = gpt4all_bot.generate(prompt, max_length=max_tokens)
+    with llm_slots.slot(), _generate_lock:
+        resp = bot.generate(prompt, max_length=max_tokens)
     return resp
 
 def ask_openai(prompt, model="gpt-3.5-turbo", max_tokens=256):
     key = os.environ.get("OPENAI_API_KEY")
     if not key:
         raise RuntimeError("OPENAI_API_KEY not set")
+    import openai
     openai.api_key = key
-    completion = openai.ChatCompletion.create(
-        model=model,
-        messages=[{"role":"user","content":prompt}],
-        max_tokens=max_tokens,
-        temperature=0.2
-    )
+    with llm_slots.slot():
+        completion = openai.ChatCompletion.create(
+            model=model,
+            messages=[{"role":"user","content":prompt}],
+            max_tokens=max_tokens,
+            temperature=0.2
+        )
     return completion.choices[0].message.content
 
 def ask_llm(prompt):
     # prefer local
     if GPT4ALL_AVAILABLE and os.path.exists(LOCAL_MODEL_PATH):
         try:
-            return ask_local_gpt4all(prompt)
+            return llm_cache.cache.cached(
+                f"gpt4all:{os.path.basename(LOCAL_MODEL_PATH)}", prompt,
+                lambda: ask_local_gpt4all(prompt)
+            )
+        except llm_slots.Busy:
+            raise
         except Exception as e:
             # fallback to OpenAI if configured
             print("gpt4all failed:", e)
     if OPENAI_AVAILABLE and os.environ.get("OPENAI_API_KEY"):
-        return ask_openai(prompt)
+        return llm_cache.cache.cached("openai:gpt-3.5-turbo", prompt, lambda: ask_openai(prompt))
     raise RuntimeError("No LLM available. Install gpt4all and download model, or set OPENAI_API_KEY")
@@ -0,0 +1,178 @@
+# llm_queue.py
+# Job queue in front of the LLM backends. A fixed number of worker threads
+# run prompts; requests beyond the queue depth are refused (HTTP 429) instead
+# of piling up web threads behind a model that answers one prompt at a time.
+# The backends take llm_slots slots, so queued jobs, inline calls and streams
+# share the same LLM_WORKERS model calls.
+#
+#   LLM_WORKERS=2 LLM_QUEUE_SIZE=32 python app.py
+
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+
+import ai_module
+import llm_integration
+import llm_slots
+
+WORKERS = llm_slots.SLOTS
+QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", 32))
+JOB_TTL = 600          # seconds a finished job stays pollable
+TIMING_WINDOW = 1000   # recent jobs kept for the wait/generation percentiles
+
+
+
+# ai_module.generate is ask_ai without the error-to-text conversion, so
+# failures mark the job as an error
+BACKENDS = {
+    "ollama": ai_module.generate,
+    "local": llm_integration.ask_llm,
+}
+
+
+class QueueFull(llm_slots.Busy):
+    pass
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0, "avg": None, "p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+    return {
+        "count": len(ordered),
+        "avg": round(sum(ordered) / len(ordered), 4),
+        "p50": pick(0.5),
+        "p95": pick(0.95),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class LLMQueue:
+    def __init__(self, workers=WORKERS, maxsize=QUEUE_SIZE, job_ttl=JOB_TTL):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.job_ttl = job_ttl
+        self.queue = queue.Queue(maxsize)
+        self.jobs = {}                   # job id -> job dict
+        self.lock = threading.Lock()
+        self.threads = []
+        self.pid = os.getpid()
+        self.waits = deque(maxlen=TIMING_WINDOW)
+        self.generation = deque(maxlen=TIMING_WINDOW)
+        self.counts = {"submitted": 0, "rejected": 0, "done": 0, "error": 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"llm-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, prompt, backend="ollama", owner=None):
+        """
+        Queue a prompt and return its job id. Raises QueueFull when saturated.
+        owner (a user id) is kept on the job so only that user can read it.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend: {backend}")
+        job = {
+            "id": uuid.uuid4().hex,
+            "backend": backend,
+            "owner": owner,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        with self.lock:
+            self._prune(job["submitted_at"])
+            try:
+                self.queue.put_nowait((job, prompt))
+            except queue.Full:
+                self.counts["rejected"] += 1
+                raise QueueFull(f"LLM queue full ({self.maxsize} waiting)") from None
+            self.jobs[job["id"]] = job
+            self.counts["submitted"] += 1
+        return job["id"]
+
+    def job(self, job_id):
+        """A copy of the job, or None if it is unknown or expired."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def ask(self, prompt, backend="ollama", timeout=None):
+        """Submit and wait for the answer (for callers that need it inline)."""
+        job_id = self.submit(prompt, backend)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.job(job_id)
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "error":
+                raise RuntimeError(job["error"])
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"LLM job {job_id} still {job['status']}")
+            time.sleep(0.05)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.maxsize,
+                "queued": self.queue.qsize(),
+                "running": sum(j["status"] == "running" for j in self.jobs.values()),
+                **self.counts,
+                "queue_wait": percentiles(self.waits),
+                "generation": percentiles(self.generation),
+            }
+
+    def _prune(self, now):
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > self.job_ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _run(self):
+        llm_slots.wait_forever()   # backpressure is the queue's job, not the slots'
+        while True:
+            job, prompt = self.queue.get()
+            with self.lock:
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                self.waits.append(job["started_at"] - job["submitted_at"])
+            try:
+                result, error = BACKENDS[job["backend"]](prompt), None
+            except Exception as e:
+                result, error = None, str(e)
+            with self.lock:
+                job["finished_at"] = time.time()
+                job["result"], job["error"] = result, error
+                job["status"] = "done" if error is None else "error"
+                self.counts[job["status"]] += 1
+                self.generation.append(job["finished_at"] - job["started_at"])
+            self.queue.task_done()
+
+
+# --------------------------
+# PROCESS-WIDE QUEUE
+# --------------------------
+_queue = None
+_lock = threading.Lock()
+
+
+def get_queue():
+    """Start the workers once per process (safe to call from every request)."""
+    global _queue
+    with _lock:
+        if _queue is None or _queue.pid != os.getpid():
+            _queue = LLMQueue().start()
+        return _queue
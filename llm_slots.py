@@ -0,0 +1,59 @@
+# llm_slots.py
+# Process-wide cap on concurrent model calls. Every path to a model takes a
+# slot first: the llm_queue workers, inline ai_module.ask_ai and
+# llm_integration.ask_llm calls, and the streamed assistant answers. Cached
+# answers do not need one.
+#
+#   LLM_WORKERS=2 LLM_SLOT_WAIT=10 python app.py
+
+import os
+import threading
+from contextlib import contextmanager
+
+SLOTS = int(os.environ.get("LLM_WORKERS", 2))
+SLOT_WAIT = float(os.environ.get("LLM_SLOT_WAIT", 10))   # seconds to wait for a free slot
+
+
+class Busy(RuntimeError):
+    """Every slot stayed taken for SLOT_WAIT seconds (HTTP 429)."""
+
+
+_semaphore = None
+_semaphore_pid = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_semaphore():
+    global _semaphore, _semaphore_pid
+    with _lock:
+        if _semaphore is None or _semaphore_pid != os.getpid():
+            _semaphore = threading.BoundedSemaphore(SLOTS)
+            _semaphore_pid = os.getpid()
+        return _semaphore
+
+
+def wait_forever():
+    """
+    Make slot() on the calling thread wait as long as it takes instead of
+    raising Busy. For llm_queue workers: a job already taken off the queue
+    waits for its turn rather than failing.
+    """
+    _local.wait_forever = True
+
+
+@contextmanager
+def slot(timeout=None):
+    """
+    Hold one of the SLOTS for the block. Raises Busy if none frees up within
+    timeout (default SLOT_WAIT) seconds, unless the thread called wait_forever.
+    """
+    semaphore = get_semaphore()
+    if timeout is None and getattr(_local, "wait_forever", False):
+        semaphore.acquire()
+    elif not semaphore.acquire(timeout=SLOT_WAIT if timeout is None else timeout):
+        raise Busy(f"all {SLOTS} LLM slots busy, try again shortly")
+    try:
+        yield
+    finally:
+        semaphore.release()
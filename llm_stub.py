@@ -0,0 +1,95 @@
+# llm_stub.py
+# Stand-in for an Ollama server: POST /api/generate streams the prompt's
+# words back as NDJSON tokens, so the assistant can be run and benchmarked
+# without a model.
+#
+#   python llm_stub.py [port]                   # default 11434
+#   STUB_TOKEN_DELAY=0.05 python llm_stub.py     # seconds between tokens
+#   OLLAMA_URL=http://127.0.0.1:11434 python app.py
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN_DELAY = float(os.environ.get("STUB_TOKEN_DELAY", 0.02))
+MAX_TOKENS = 64
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, chunked responses
+
+    def setup(self):
+        super().setup()
+        # send each token right away, like Ollama does
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            return self.send_json(200, {"models": [{"name": "stub"}]})
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            return self.send_json(404, {"error": "not found"})
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        words = body.get("prompt", "").split()[-MAX_TOKENS:] or ["ok"]
+        tokens = [w + " " for w in words]
+        model = body.get("model", "stub")
+        with self.server.lock:
+            self.server.requests += 1
+
+        if not body.get("stream", True):
+            time.sleep(self.server.token_delay * len(tokens))
+            return self.send_json(200, {"model": model, "response": "".join(tokens), "done": True})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(self.server.token_delay)
+            self.write_chunk(json.dumps({"model": model, "response": token, "done": False}).encode() + b"\n")
+        self.write_chunk(json.dumps({"model": model, "response": "", "done": True}).encode() + b"\n")
+        self.write_chunk(b"")
+
+
+def serve(port=0, token_delay=TOKEN_DELAY):
+    """Start the stub on a background thread; returns the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.token_delay = token_delay
+    server.lock = threading.Lock()
+    server.connections = server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 11434
+    server = serve(port)
+    print(f"LLM stub on http://127.0.0.1:{server.server_port} (token delay {server.token_delay}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,118 @@
+# pubsub.py
+# In-process publish/subscribe behind the /events stream: booking chat and
+# workspace posts, and unread-count changes, are pushed to the browsers that
+# are subscribed instead of every tab polling the database.
+#
+# Channels: "user:<id>" (unread counts), "booking:<id>" (booking chat),
+# "workspace". Events only reach subscribers in the same process, so serve
+# the app from one process with threads (each open stream holds a thread).
+# Unread counts are re-read from the database every UNREAD_TTL seconds, so
+# with several worker processes a count is never more than that out of date.
+
+import json
+import time
+import queue
+import threading
+
+QUEUE_SIZE = 100   # events buffered per subscriber before it is dropped
+HEARTBEAT = 15     # seconds between keep-alive comments on an idle stream
+UNREAD_TTL = 30    # seconds a cached unread count is trusted
+
+
+def format_event(event, data):
+    """One server-sent event; the browser dispatches it by event name."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    def __init__(self, channels):
+        self.channels = channels
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.dropped = False
+
+
+class Broker:
+    def __init__(self):
+        self.channels = {}   # channel -> set of subscriptions
+        self.unread = {}     # user id -> (unread booking messages, loaded at)
+        self.lock = threading.Lock()
+        self.unread_lock = threading.Lock()
+
+    def subscribe(self, channels):
+        sub = Subscription(list(channels))
+        with self.lock:
+            for channel in sub.channels:
+                self.channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            for channel in sub.channels:
+                subs = self.channels.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self.channels[channel]
+
+    def publish(self, channel, event, data):
+        with self.lock:
+            subs = list(self.channels.get(channel, ()))
+        for sub in subs:
+            try:
+                sub.queue.put_nowait((event, data))
+            except queue.Full:
+                # a client that stopped reading; its EventSource reconnects
+                # and starts again from the current state
+                sub.dropped = True
+                self.unsubscribe(sub)
+
+    def subscribers(self):
+        with self.lock:
+            return sum(len(subs) for subs in self.channels.values())
+
+    # --------------------------
+    # UNREAD COUNTERS
+    # --------------------------
+    def unread_count(self, user_id, load):
+        """
+        The user's unread count. load() reads it from the database the first
+        time and again once the cached count is UNREAD_TTL old, which picks
+        up messages sent through other processes. The load happens under the
+        lock, so an add_unread() arriving meanwhile is applied after it.
+        """
+        with self.unread_lock:
+            cached = self.unread.get(user_id)
+            if cached is None or time.monotonic() - cached[1] > UNREAD_TTL:
+                cached = self.unread[user_id] = (load(), time.monotonic())
+            return cached[0]
+
+    def add_unread(self, user_id, delta):
+        """
+        Apply a change and push the new count. Users not counted yet are
+        skipped: their first unread_count() reads the committed rows.
+        """
+        with self.unread_lock:
+            cached = self.unread.get(user_id)
+            if cached is None:
+                return
+            count = max(0, cached[0] + delta)
+            self.unread[user_id] = (count, cached[1])
+        self.publish(f"user:{user_id}", "unread", {"unread": count})
+
+def stream(sub, first=None):
+    """Server-sent events for one subscription until the client goes away."""
+    try:
+        if first is not None:
+            yield format_event(*first)
+        while not sub.dropped:
+            try:
+                event, data = sub.queue.get(timeout=HEARTBEAT)
+            except queue.Empty:
+                yield ": ping\n\n"   # also notices closed connections
+                continue
+            yield format_event(event, data)
+    finally:
+        broker.unsubscribe(sub)
+
+
+broker = Broker()
@@ -0,0 +1,91 @@
+# reservations.py
+# Atomic capacity reservation shared by booking, cancellation, modification
+# and hold expiry. Capacity checks happen inside the UPDATE itself, so two
+# forwarders racing for the last kilos cannot both win.
+
+from contextlib import contextmanager
+
+import utilization
+
+
+@contextmanager
+def write_transaction(db):
+    """
+    Run the block as one write transaction. BEGIN IMMEDIATE takes the write
+    lock up front: a deferred transaction that reads and then tries to write
+    can fail with "database is locked" without waiting on the busy timeout.
+    """
+    if not db.in_transaction:
+        db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def reserve(db, flight_id, weight):
+    """
+    Take weight off the flight if (and only if) enough capacity is left.
+    Returns False when the flight is full or does not exist.
+    """
+    taken = db.execute(
+        "UPDATE flights SET capacity = capacity - ? WHERE id=? AND capacity >= ?",
+        (weight, flight_id, weight)
+    ).rowcount
+    if not taken:
+        return False
+    utilization.apply(db, flight_id, capacity=-weight, held=weight)
+    return True
+
+
+def release(db, booking_id, from_status, to_status):
+    """
+    Move a booking from from_status to to_status and give its weight back to
+    the flight. The status check is part of the UPDATE, so a booking is
+    released at most once however many requests race for it. Returns the
+    released booking row, or None if it was no longer in from_status.
+    """
+    booking = db.execute(
+        "SELECT id, flight_id, weight, status FROM bookings WHERE id=?",
+        (booking_id,)
+    ).fetchone()
+    if booking is None:
+        return None
+
+    moved = db.execute(
+        "UPDATE bookings SET status=? WHERE id=? AND status=?",
+        (to_status, booking_id, from_status)
+    ).rowcount
+    if not moved:
+        return None
+
+    weight = booking[2] or 0
+    db.execute(
+        "UPDATE flights SET capacity = capacity + ? WHERE id=?",
+        (weight, booking[1])
+    )
+    if from_status == "HOLD":
+        utilization.apply(db, booking[1], capacity=weight, held=-weight)
+    else:
+        utilization.apply(db, booking[1], capacity=weight, confirmed=-weight)
+    return booking
+
+
+def confirm(db, booking_id, now):
+    """HOLD -> CONFIRMED, unless the hold ran out or was released meanwhile."""
+    booking = db.execute(
+        "SELECT flight_id, weight FROM bookings WHERE id=?", (booking_id,)
+    ).fetchone()
+    if booking is None:
+        return False
+
+    moved = db.execute("""
+        UPDATE bookings SET status='CONFIRMED', confirmed_at=?
+        WHERE id=? AND status='HOLD' AND expires_at >= ?
+    """, (now, booking_id, now)).rowcount
+    if not moved:
+        return False
+    utilization.apply(db, booking[0], held=-booking[1], confirmed=booking[1])
+    return True
@@ -0,0 +1,308 @@
+# routing.py
+# Multi-leg interline routing over an in-memory time-expanded flight graph.
+
+import time
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import date as Date
+
+import database
+import utilization
+
+DAY = 24 * 60
+
+# Search defaults (minutes)
+MAX_LEGS = 3
+MIN_CONNECTION = 60
+MAX_LAYOVER = 24 * 60
+MAX_RESULTS = 10
+
+CHECK_INTERVAL = 10    # seconds between checks for flight/booking changes
+
+
+def day_start(date_str):
+    """Minutes since epoch for 00:00 on a YYYY-MM-DD date."""
+    return Date.fromisoformat(str(date_str).strip()).toordinal() * DAY
+
+
+def clock_minutes(hhmm):
+    h, m = str(hhmm).strip().split(":")[:2]
+    return int(h) * 60 + int(m)
+
+
+def flight_times(date, departure_time, arrival_time, duration_minutes):
+    """
+    (departure, arrival, timed) in absolute minutes. Flights uploaded without
+    schedule times depart at 00:00 of their date and are marked untimed.
+    """
+    start = day_start(date)
+    try:
+        dep = start + clock_minutes(departure_time)
+    except (ValueError, AttributeError):
+        return start, start + (duration_minutes or 0), False
+
+    if duration_minutes:
+        return dep, dep + int(duration_minutes), True
+    try:
+        arr = start + clock_minutes(arrival_time)
+    except (ValueError, AttributeError):
+        return dep, dep, True
+    if arr < dep:
+        arr += DAY  # overnight arrival
+    return dep, arr, True
+
+
+class Route:
+    """All flights on one origin→destination pair, sorted by departure."""
+
+    __slots__ = ("dep", "arr", "ids", "caps", "cargo", "timed")
+
+    def __init__(self, flights):
+        flights.sort()
+        self.dep = array("q", (f[0] for f in flights))
+        self.arr = array("q", (f[1] for f in flights))
+        self.ids = array("q", (f[2] for f in flights))
+        self.caps = array("d", (f[3] for f in flights))
+        self.cargo = array("H", (f[4] for f in flights))
+        self.timed = array("b", (f[5] for f in flights))
+
+
+class FlightGraph:
+    """
+    Time-expanded graph: airports are nodes and every flight is an edge from
+    (origin, departure) to (destination, arrival).
+    """
+
+    def __init__(self, rows):
+        self.routes = {}
+        self.cargo_types = []
+        cargo_index = {}
+        current, flights = None, []
+
+        for r in rows:
+            key = (r["origin"], r["destination"])
+            if key != current:
+                if flights:
+                    self.routes.setdefault(current[0], {})[current[1]] = Route(flights)
+                current, flights = key, []
+            try:
+                dep, arr, timed = flight_times(
+                    r["date"], r["departure_time"], r["arrival_time"], r["duration_minutes"]
+                )
+            except ValueError:
+                continue  # unparsable date
+            cargo = r["cargo_type"] or "General"
+            if cargo not in cargo_index:
+                cargo_index[cargo] = len(self.cargo_types)
+                self.cargo_types.append(cargo)
+            flights.append((dep, arr, r["id"], r["capacity"] or 0, cargo_index[cargo], timed))
+
+        if flights:
+            self.routes.setdefault(current[0], {})[current[1]] = Route(flights)
+
+    def search(self, origin, destination, date, max_legs=MAX_LEGS, k=MAX_RESULTS,
+               min_connection=MIN_CONNECTION, max_layover=MAX_LAYOVER,
+               cargo_type=None, same_cargo_type=False, min_capacity=0, min_legs=1):
+        """
+        Up to k itineraries from origin to destination whose first leg
+        departs on `date`, ordered by arrival time. Best-first search where
+        every airport may be settled at most k times (k-shortest paths).
+        """
+        try:
+            start = day_start(date)
+        except ValueError:
+            return []
+        if cargo_type is not None and cargo_type not in self.cargo_types:
+            return []
+        wanted_cargo = None if cargo_type is None else self.cargo_types.index(cargo_type)
+
+        # label: (airport, legs, parent, route, position)
+        labels = [(origin, 0, -1, None, -1)]
+        heap = [(start, 0)]
+        settled = {}
+        results = []
+
+        while heap and len(results) < k:
+            arrival, idx = heapq.heappop(heap)
+            airport, legs, parent, route, pos = labels[idx]
+
+            if airport == destination and legs:
+                if legs >= min_legs:
+                    results.append(self._itinerary(labels, idx))
+                continue
+
+            cargo = route.cargo[pos] if route is not None else None
+            node = (airport, cargo) if same_cargo_type else airport
+            if legs:
+                settled[node] = settled.get(node, 0) + 1
+                if settled[node] > k:
+                    continue
+            if legs == max_legs:
+                continue
+
+            visited = self._path_airports(labels, idx)
+            if legs == 0:
+                lo, hi = start, start + DAY
+                ready, prev_timed = start, False
+            else:
+                prev_timed = route.timed[pos]
+                ready = arrival + min_connection if prev_timed else arrival
+                lo, hi = ready - ready % DAY, arrival + max_layover
+
+            for nxt, r in self.routes.get(airport, {}).items():
+                if nxt in visited:
+                    continue
+                if nxt == destination and legs + 1 < min_legs:
+                    continue
+                if nxt != destination and legs + 1 == max_legs:
+                    continue
+
+                taken = 0
+                i = bisect_left(r.dep, lo)
+                while i < len(r.dep) and r.dep[i] < hi and taken < k:
+                    if (r.timed[i] and prev_timed and r.dep[i] < ready) \
+                            or r.caps[i] < min_capacity \
+                            or (wanted_cargo is not None and r.cargo[i] != wanted_cargo) \
+                            or (same_cargo_type and cargo is not None and r.cargo[i] != cargo):
+                        i += 1
+                        continue
+                    labels.append((nxt, legs + 1, idx, r, i))
+                    heapq.heappush(heap, (r.arr[i], len(labels) - 1))
+                    taken += 1
+                    i += 1
+
+        return results
+
+    def _path_airports(self, labels, idx):
+        airports = set()
+        while idx >= 0:
+            airports.add(labels[idx][0])
+            idx = labels[idx][2]
+        return airports
+
+    def _itinerary(self, labels, idx):
+        legs = []
+        while labels[idx][3] is not None:
+            _, _, parent, route, pos = labels[idx]
+            legs.append((route, pos))
+            idx = parent
+        legs.reverse()
+
+        first, last = legs[0], legs[-1]
+        departure = first[0].dep[first[1]]
+        arrival = last[0].arr[last[1]]
+        return {
+            "flight_ids": [r.ids[p] for r, p in legs],
+            "departure": departure,
+            "arrival": arrival,
+            "transit_minutes": arrival - departure,
+            "timed": all(r.timed[p] for r, p in legs),
+        }
+
+
+# --------------------------
+# TWO-LEG SQL MATCH
+# --------------------------
+def two_leg_routes(db, origin, destination, date, same_cargo_type=False):
+    """
+    Same-date two-leg connections as a single self-join, one row per
+    distinct (origin, via, destination, capacity). Uses the route/date
+    index for the second leg, so hubs never get compared pairwise in Python.
+    """
+    leg_capacity = (
+        "CASE WHEN f1.capacity < f2.capacity THEN f1.capacity ELSE f2.capacity END"
+    )
+    query = f"""
+        SELECT f1.id AS leg1_id, f2.id AS leg2_id,
+               {leg_capacity} AS leg_capacity,
+               f1.cargo_type AS cargo_type,
+               ROW_NUMBER() OVER (
+                   PARTITION BY f1.destination, {leg_capacity} ORDER BY f1.id
+               ) AS pick
+        FROM flights f1
+        JOIN flights f2
+          ON f2.origin = f1.destination AND f2.destination = ? AND f2.date = f1.date
+        WHERE f1.origin = ? AND f1.date = ?
+    """
+    if same_cargo_type:
+        query += " AND f2.cargo_type = f1.cargo_type"
+    # plain SQL (no SQLite bare-column GROUP BY) so it runs on PostgreSQL too
+    query = f"""
+        SELECT leg1_id, leg2_id, leg_capacity, cargo_type
+        FROM ({query}) AS pairs
+        WHERE pick = 1
+        ORDER BY leg_capacity DESC
+    """
+    return db.execute(query, (destination, origin, date)).fetchall()
+
+
+# --------------------------
+# SHARED GRAPH CACHE
+# --------------------------
+GRAPH_ROWS_SQL = """
+    SELECT id, origin, destination, date, departure_time, arrival_time,
+           duration_minutes, capacity, cargo_type
+    FROM flights
+    ORDER BY origin, destination
+"""
+
+_graph = None
+_graph_key = None
+_checked_at = 0.0
+_refreshing = False
+_lock = threading.Lock()
+
+
+def build(db):
+    return FlightGraph(db.execute(GRAPH_ROWS_SQL))
+
+
+def get_graph(db):
+    """
+    Process-wide graph, checked against utilization.flights_key() at most
+    every CHECK_INTERVAL seconds. Only the first build blocks: after a change
+    the old graph keeps serving searches while a new one is built in the
+    background. Bookings do not trigger a rebuild: the capacities in the
+    graph go stale, and callers re-read each leg's flights row
+    (app.interline_routes). Call invalidate() after upserting flights.
+    """
+    global _graph, _graph_key, _checked_at, _refreshing
+    with _lock:
+        now = time.monotonic()
+        if _graph is not None and (_refreshing or now - _checked_at < CHECK_INTERVAL):
+            return _graph
+        _checked_at = now
+        key = utilization.flights_key(db)
+        if _graph is None:
+            _graph, _graph_key = build(db), key
+        elif key != _graph_key:
+            _refreshing = True
+            threading.Thread(target=_refresh, args=(key,), name="flight-graph", daemon=True).start()
+        return _graph
+
+
+def _refresh(key):
+    global _graph, _graph_key, _refreshing
+    graph = None
+    try:
+        db = database.connect()
+        try:
+            graph = build(db)
+        finally:
+            db.close()
+    except Exception as e:   # sqlite3 or psycopg errors
+        print("flight graph refresh failed:", e)
+    with _lock:
+        if graph is not None:
+            _graph, _graph_key = graph, key
+        _refreshing = False
+
+
+def invalidate():
+    """Check for changes (and rebuild) on the next search."""
+    global _graph_key, _checked_at
+    with _lock:
+        _graph_key = None
+        _checked_at = 0.0
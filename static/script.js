@@ -76,25 +76,10 @@ function startCountdown(expireTime, displayId) {
 
 
 /* ============================================================
-   AUTO-REFRESH WORKSPACE CHAT
+   LIVE WORKSPACE CHAT
+   New workspace posts are pushed over /events (see base.html);
+   there is nothing to poll.
    ============================================================ */
-function startChatAutoRefresh() {
-    const box = document.getElementById("messageBox");
-    if (!box) return;
-
-    setInterval(() => {
-        fetch("/workspace_data")
-            .then(r => r.json())
-            .then(data => {
-                box.innerHTML = "";
-                data.messages.forEach(m => {
-                    box.innerHTML += `<div class="message"><b>${m.sender}:</b> ${m.text}</div>`;
-                });
-            });
-    }, 3000);
-}
-
-startChatAutoRefresh();
 
 
 /* ============================================================
@@ -0,0 +1,535 @@
+# storage.py
+# Data access for the web app. The route handlers call a Repository instead
+# of writing SQL; SQLiteRepository and PostgresRepository only differ where
+# the two databases do (driver, generated ids, DDL).
+#
+#   CARGO_DB_BACKEND=sqlite                      (default, uses cargo.db)
+#   CARGO_DB_BACKEND=postgres DATABASE_URL=postgresql://localhost/cargo
+#
+#   python storage.py init                       # create the postgres schema
+
+import sys
+import time
+import sqlite3
+from flask import g
+
+import database
+import reservations
+import utilization
+from database import UPSERT_FLIGHT_SQL
+
+# Keyset pagination: pages continue from the last id seen ("cursor"), so a
+# page costs the same however deep into the list it is.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class Repository:
+    """Every query the web app runs, against one borrowed connection."""
+
+    integrity_errors = ()
+
+    def __init__(self, db):
+        self.db = db
+
+    def insert(self, sql, params):
+        """Run an INSERT and return the new row's id."""
+        return self.db.execute(sql, params).lastrowid
+
+    def transaction(self):
+        return reservations.write_transaction(self.db)
+
+    def page(self, sql, params, limit):
+        """
+        Run a query ordered by id with LIMIT limit + 1. Returns (rows, cursor)
+        where cursor is the id to continue from, or None on the last page.
+        """
+        rows = self.db.execute(f"{sql} LIMIT ?", (*params, limit + 1)).fetchall()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
+
+    # --------------------------
+    # USERS
+    # --------------------------
+    def create_user(self, username, password, role):
+        """Returns False if the username is already taken."""
+        try:
+            with self.transaction():
+                self.insert(
+                    "INSERT INTO users(username,password,role) VALUES(?,?,?)",
+                    (username, password, role)
+                )
+        except self.integrity_errors:
+            return False
+        return True
+
+    def user(self, user_id):
+        return self.db.execute("SELECT * FROM users WHERE id=?", (user_id,)).fetchone()
+
+    def user_by_username(self, username):
+        return self.db.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
+
+    def update_profile(self, user_id, email, phone, company, profile_pic=None):
+        with self.transaction():
+            if profile_pic:
+                self.db.execute(
+                    "UPDATE users SET profile_pic=? WHERE id=?", (profile_pic, user_id)
+                )
+            self.db.execute(
+                "UPDATE users SET email=?, phone=?, company=? WHERE id=?",
+                (email, phone, company, user_id)
+            )
+
+    # --------------------------
+    # FLIGHTS
+    # --------------------------
+    def flight(self, flight_id):
+        return self.db.execute("SELECT * FROM flights WHERE id=?", (flight_id,)).fetchone()
+
+    def flights_by_id(self, ids):
+        ids = list(ids)
+        if not ids:
+            return {}
+        rows = self.db.execute(
+            f"SELECT * FROM flights WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return {f["id"]: f for f in rows}
+
+    def find_flights(self, origin, destination, date=None, cargo_type=None):
+        query = "SELECT * FROM flights WHERE origin=? AND destination=?"
+        params = [origin, destination]
+        if date:
+            query += " AND date=?"
+            params.append(date)
+        if cargo_type:
+            query += " AND cargo_type=?"
+            params.append(cargo_type)
+        return self.db.execute(query, params).fetchall()
+
+    def flights_with_capacity_over(self, capacity, cursor=None, limit=PAGE_SIZE):
+        """Oldest first; cursor is the last flight id of the previous page."""
+        return self.page(
+            "SELECT * FROM flights WHERE capacity > ? AND id > ? ORDER BY id",
+            (capacity, cursor or 0), limit
+        )
+
+    def upsert_flights(self, rows):
+        """Insert or update flights (FLIGHT_COLUMNS order) on their natural key."""
+        rows = list(rows)
+        with self.transaction():
+            self.db.executemany(UPSERT_FLIGHT_SQL, rows)
+            utilization.refresh_routes(self.db, [(r[2], r[3], r[4]) for r in rows])
+        return len(rows)
+
+    # --------------------------
+    # BOOKINGS
+    # --------------------------
+    def booking(self, booking_id):
+        return self.db.execute("SELECT * FROM bookings WHERE id=?", (booking_id,)).fetchone()
+
+    def bookings(self, user, cursor=None, limit=PAGE_SIZE):
+        """
+        Newest first: a forwarder's own bookings, or the bookings on an
+        airline user's flights (users.company = flights.airline). Airline
+        accounts without a company still see every booking.
+        """
+        before = cursor if cursor is not None else sys.maxsize
+        if user["role"] == "airline" and not user["company"]:
+            return self.page(
+                "SELECT * FROM bookings WHERE id < ? ORDER BY id DESC", (before,), limit
+            )
+        if user["role"] == "airline":
+            return self.page("""
+                SELECT b.* FROM bookings b JOIN flights f ON f.id = b.flight_id
+                WHERE f.airline = ? AND b.id < ?
+                ORDER BY b.id DESC
+            """, (user["company"], before), limit)
+        return self.page(
+            "SELECT * FROM bookings WHERE user_id = ? AND id < ? ORDER BY id DESC",
+            (user["id"], before), limit
+        )
+
+    def create_hold(self, user_id, flight_id, actual_weight, volumetric_weight,
+                    chargeable_weight, rate, total, expires_at):
+        """
+        Reserve capacity and create a HOLD booking, or return None if the
+        flight does not have chargeable_weight left.
+        """
+        with self.transaction():
+            # capacity is checked and taken in one statement
+            if not reservations.reserve(self.db, flight_id, chargeable_weight):
+                return None
+
+            booking_id = self.insert("""
+                INSERT INTO bookings(user_id, flight_id, actual_weight, volumetric_weight,
+                chargeable_weight, weight, status, expires_at, price, total, payment_status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                user_id, flight_id,
+                actual_weight, volumetric_weight, chargeable_weight,
+                chargeable_weight,  # weight column used internally
+                "HOLD", expires_at,
+                rate, total, "UNPAID"
+            ))
+            # a new booking replaces the user's pending modification
+            self.db.execute("""
+                UPDATE bookings
+                SET status='CANCELLED'
+                WHERE user_id=? AND status='MODIFY_PENDING'
+            """, (user_id,))
+        return booking_id
+
+    def confirm_booking(self, booking_id, now):
+        with self.transaction():
+            return reservations.confirm(self.db, booking_id, now)
+
+    def release_booking(self, booking_id, from_status, to_status):
+        with self.transaction():
+            return reservations.release(self.db, booking_id, from_status, to_status) is not None
+
+    # --------------------------
+    # INVOICES
+    # --------------------------
+    INVOICE_SQL = """
+        SELECT b.*, f.airline, f.flight_no, f.origin, f.destination, f.date
+        FROM bookings b JOIN flights f ON f.id = b.flight_id
+    """
+
+    def invoice_row(self, booking_id):
+        """A booking with the flight fields printed on its invoice."""
+        return self.db.execute(f"{self.INVOICE_SQL} WHERE b.id = ?", (booking_id,)).fetchone()
+
+    @staticmethod
+    def invoice_filter(date_from, date_to, status="CONFIRMED"):
+        """WHERE clause for INVOICE_SQL: status and flight date range (inclusive)."""
+        sql, params = "b.status = ?", [status]
+        if date_from:
+            sql += " AND f.date >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " AND f.date <= ?"
+            params.append(date_to)
+        return sql, params
+
+    def invoice_rows(self, date_from=None, date_to=None, status="CONFIRMED"):
+        """Bookings to invoice, by flight date range (YYYY-MM-DD)."""
+        where, params = self.invoice_filter(date_from, date_to, status)
+        return self.db.execute(f"{self.INVOICE_SQL} WHERE {where} ORDER BY b.id", params).fetchall()
+
+    def invoice_page(self, user, date_from=None, date_to=None, cursor=None, limit=PAGE_SIZE):
+        """
+        The confirmed bookings the user may see (as in bookings()), oldest
+        first; cursor is the last booking id of the previous page.
+        """
+        where, params = self.invoice_filter(date_from, date_to)
+        if user["role"] != "airline":
+            where += " AND b.user_id = ?"
+            params.append(user["id"])
+        elif user["company"]:
+            where += " AND f.airline = ?"
+            params.append(user["company"])
+        return self.page(
+            f"{self.INVOICE_SQL} WHERE {where} AND b.id > ? ORDER BY b.id",
+            (*params, cursor or 0), limit
+        )
+
+    # --------------------------
+    # WORKSPACE MESSAGES
+    # --------------------------
+    def add_message(self, sender, text):
+        with self.transaction():
+            self.insert("INSERT INTO messages(sender,text) VALUES(?,?)", (sender, text))
+
+    def messages(self, cursor=None, limit=PAGE_SIZE):
+        """Newest first; cursor is the oldest message id already shown."""
+        return self.page(
+            "SELECT * FROM messages WHERE id < ? ORDER BY id DESC",
+            (cursor if cursor is not None else sys.maxsize,), limit
+        )
+
+    # --------------------------
+    # BOOKING CHAT
+    # --------------------------
+    def add_booking_message(self, booking_id, sender_id, message, receiver_id=None):
+        """Store a chat message and return it as a dict (for pushing to clients)."""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        with self.transaction():
+            message_id = self.insert("""
+                INSERT INTO booking_messages(booking_id, sender_id, receiver_id, message, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """, (booking_id, sender_id, receiver_id, message, timestamp))
+        return {
+            "id": message_id,
+            "booking_id": booking_id,
+            "sender_id": sender_id,
+            "message": message,
+            "timestamp": timestamp,
+        }
+
+    def chat_receiver(self, booking, sender_id):
+        """
+        The other side of a booking chat: the forwarder who booked, or else
+        an airline user of the flight's airline (users.company), falling
+        back to whoever last wrote in the thread.
+        """
+        if sender_id != booking["user_id"]:
+            return booking["user_id"]
+        row = self.db.execute("""
+            SELECT u.id FROM users u JOIN flights f ON u.company = f.airline
+            WHERE f.id = ? AND u.role = 'airline'
+            ORDER BY u.id LIMIT 1
+        """, (booking["flight_id"],)).fetchone()
+        if row is None:
+            row = self.db.execute("""
+                SELECT sender_id AS id FROM booking_messages
+                WHERE booking_id = ? AND sender_id != ?
+                ORDER BY id DESC LIMIT 1
+            """, (booking["id"], sender_id)).fetchone()
+        return row["id"] if row else None
+
+    def booking_messages(self, booking_id, cursor=None, limit=PAGE_SIZE):
+        """Newest first; cursor is the oldest message id already shown."""
+        return self.page(
+            "SELECT * FROM booking_messages WHERE booking_id = ? AND id < ? ORDER BY id DESC",
+            (booking_id, cursor if cursor is not None else sys.maxsize), limit
+        )
+
+    def mark_read(self, booking_id, user_id):
+        """Mark the user's messages in this chat read; returns how many were unread."""
+        with self.transaction():
+            return self.db.execute("""
+                UPDATE booking_messages SET is_read = 1
+                WHERE booking_id = ? AND receiver_id = ? AND is_read = 0
+            """, (booking_id, user_id)).rowcount
+
+    def unread_count(self, user_id):
+        return self.db.execute("""
+            SELECT COUNT(*) AS c FROM booking_messages
+            WHERE receiver_id = ? AND is_read = 0
+        """, (user_id,)).fetchone()["c"]
+
+
+class SQLiteRepository(Repository):
+    integrity_errors = (sqlite3.IntegrityError,)
+
+
+# --------------------------
+# POSTGRESQL
+# --------------------------
+class PostgresRow(tuple):
+    """Tuple that can also be indexed by column name, like sqlite3.Row."""
+
+    def __new__(cls, names, values):
+        row = super().__new__(cls, values)
+        row.names = names
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self.names[key]
+        return super().__getitem__(key)
+
+    def keys(self):
+        return list(self.names)
+
+
+def postgres_row_factory(cursor):
+    names = {col.name: i for i, col in enumerate(cursor.description or ())}
+    return lambda values: PostgresRow(names, values)
+
+
+class PostgresConnection:
+    """
+    psycopg connection with the sqlite3 calls the rest of the code uses:
+    qmark placeholders, BEGIN IMMEDIATE, in_transaction.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @staticmethod
+    def translate(sql, params):
+        if sql.strip().upper() == "BEGIN IMMEDIATE":
+            return "BEGIN"
+        if params:
+            return sql.replace("%", "%%").replace("?", "%s")
+        return sql
+
+    @property
+    def in_transaction(self):
+        from psycopg.pq import TransactionStatus
+
+        return self.conn.info.transaction_status != TransactionStatus.IDLE
+
+    def execute(self, sql, params=()):
+        cur = self.conn.cursor(row_factory=postgres_row_factory)
+        cur.execute(self.translate(sql, params), params or None)
+        return cur
+
+    def executemany(self, sql, seq):
+        cur = self.conn.cursor()
+        cur.executemany(self.translate(sql, True), list(seq))
+        return cur
+
+    def commit(self):
+        if self.in_transaction:
+            self.conn.execute("COMMIT")
+
+    def rollback(self):
+        if self.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresPool(database.ConnectionPool):
+    def connect(self):
+        import psycopg
+
+        # transactions are opened explicitly (reservations.write_transaction)
+        return PostgresConnection(psycopg.connect(self.path, autocommit=True))
+
+
+class PostgresRepository(Repository):
+
+    def __init__(self, db):
+        import psycopg
+
+        super().__init__(db)
+        self.integrity_errors = (psycopg.IntegrityError,)
+
+    def insert(self, sql, params):
+        return self.db.execute(sql + " RETURNING id", params).fetchone()[0]
+
+
+POSTGRES_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id BIGSERIAL PRIMARY KEY,
+        username TEXT UNIQUE,
+        password TEXT,
+        role TEXT,
+        email TEXT,
+        phone TEXT,
+        company TEXT,
+        profile_pic TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS flights (
+        id BIGSERIAL PRIMARY KEY,
+        airline TEXT,
+        flight_no TEXT,
+        origin TEXT,
+        destination TEXT,
+        date TEXT,
+        capacity DOUBLE PRECISION,
+        cargo_type TEXT,
+        departure_time TEXT,
+        arrival_time TEXT,
+        duration_minutes INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bookings (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        flight_id BIGINT,
+        weight DOUBLE PRECISION,
+        status TEXT,
+        expires_at BIGINT,
+        price DOUBLE PRECISION,
+        total DOUBLE PRECISION,
+        payment_status TEXT DEFAULT 'UNPAID',
+        actual_weight DOUBLE PRECISION,
+        volumetric_weight DOUBLE PRECISION,
+        chargeable_weight DOUBLE PRECISION,
+        length DOUBLE PRECISION,
+        width DOUBLE PRECISION,
+        height DOUBLE PRECISION,
+        confirmed_at BIGINT,
+        penalty_paid DOUBLE PRECISION DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id BIGSERIAL PRIMARY KEY,
+        sender TEXT,
+        text TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS booking_messages (
+        id BIGSERIAL PRIMARY KEY,
+        booking_id BIGINT,
+        sender_id BIGINT,
+        message TEXT,
+        timestamp TEXT,
+        receiver_id BIGINT,
+        is_read INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS feed_state (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        synced_at BIGINT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS route_utilization (
+        origin TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        date TEXT NOT NULL,
+        cargo_type TEXT NOT NULL,
+        capacity DOUBLE PRECISION DEFAULT 0,
+        held DOUBLE PRECISION DEFAULT 0,
+        confirmed DOUBLE PRECISION DEFAULT 0,
+        PRIMARY KEY ({utilization.KEY})
+    )
+    """,
+]
+
+
+def init_postgres(dsn=None):
+    """Create the schema (tables and the same indexes as SQLite) if missing."""
+    db = PostgresPool(dsn or database.DATABASE_URL).connect()
+    try:
+        for ddl in POSTGRES_TABLES:
+            db.execute(ddl)
+        for name, target in database.INDEXES.items():
+            db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        for name, target in database.UNIQUE_INDEXES.items():
+            db.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {target}")
+    finally:
+        db.close()
+
+
+# --------------------------
+# PER-REQUEST REPOSITORY
+# --------------------------
+REPOSITORIES = {
+    "sqlite": SQLiteRepository,
+    "postgres": PostgresRepository,
+}
+
+
+def get_repo():
+    """Repository over the request's pooled connection (see database.get_db)."""
+    repo = getattr(g, "_repository", None)
+    if repo is None:
+        repo = g._repository = REPOSITORIES[database.BACKEND](database.get_db())
+    return repo
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["init"]:
+        init_postgres()
+        print("Initialized", database.DATABASE_URL)
+    else:
+        print("usage: python storage.py init")
+        sys.exit(1)
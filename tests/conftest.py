@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import utilization
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh, fully migrated SQLite database."""
+    path = str(tmp_path / "cargo.db")
+    database.init_db(path)
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    conn = database.connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def add_flight(db):
+    """add_flight(capacity) -> id of a new DXB→LHR flight, with its summary row."""
+    def add(capacity, flight_no="EK1"):
+        cur = db.execute("""
+            INSERT INTO flights (airline, flight_no, origin, destination, date, capacity, cargo_type)
+            VALUES ('Emirates', ?, 'DXB', 'LHR', '2025-12-10', ?, 'General')
+        """, (flight_no, capacity))
+        utilization.refresh_routes(db, [("DXB", "LHR", "2025-12-10")])
+        db.commit()
+        return cur.lastrowid
+    return add
@@ -0,0 +1,140 @@
+import time
+
+import hold_expiry
+import reservations
+import utilization
+
+MAX_DELAY = 2.0   # seconds past expiry a hold may stay HOLD
+VOLUME = 5000     # holds in the volume test, several worker batches
+
+
+def hold(db, flight_id, weight, expires_at):
+    """Reserve weight on the flight as a HOLD booking, like /book does."""
+    with reservations.write_transaction(db):
+        assert reservations.reserve(db, flight_id, weight)
+        cur = db.execute("""
+            INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight, status, expires_at)
+            VALUES (1, ?, ?, ?, 'HOLD', ?)
+        """, (flight_id, weight, weight, expires_at))
+    return cur.lastrowid
+
+
+def capacity(db, flight_id):
+    return db.execute("SELECT capacity FROM flights WHERE id=?", (flight_id,)).fetchone()[0]
+
+
+def status(db, booking_id):
+    return db.execute("SELECT status FROM bookings WHERE id=?", (booking_id,)).fetchone()[0]
+
+
+def test_expired_hold_releases_capacity(db, add_flight):
+    flight = add_flight(1000)
+    now = int(time.time())
+    booking = hold(db, flight, 300, now - 10)
+    assert capacity(db, flight) == 700
+
+    assert hold_expiry.expire_holds(db, [booking], now) == [(booking, now - 10)]
+    assert status(db, booking) == "CANCELLED"
+    assert capacity(db, flight) == 1000
+    assert utilization.check(db) == []
+
+
+def test_hold_is_kept_until_it_expires(db, add_flight):
+    flight = add_flight(1000)
+    now = int(time.time())
+    booking = hold(db, flight, 300, now)
+
+    # a hold expiring at T is still valid during second T
+    assert hold_expiry.expire_holds(db, [booking], now) == []
+    assert hold_expiry.due_holds(db, now) == []
+    assert status(db, booking) == "HOLD"
+    assert capacity(db, flight) == 700
+
+
+def test_expired_hold_is_released_once(db, add_flight):
+    flight = add_flight(1000)
+    now = int(time.time())
+    booking = hold(db, flight, 300, now - 10)
+
+    hold_expiry.expire_holds(db, [booking], now)
+    assert hold_expiry.expire_holds(db, [booking], now) == []
+    assert capacity(db, flight) == 1000
+
+
+def test_confirm_after_expiry_fails(db, add_flight):
+    flight = add_flight(1000)
+    now = int(time.time())
+    booking = hold(db, flight, 300, now - 10)
+
+    with reservations.write_transaction(db):
+        assert not reservations.confirm(db, booking, now)
+    assert status(db, booking) == "HOLD"
+
+    hold_expiry.expire_holds(db, [booking], now)
+    with reservations.write_transaction(db):
+        assert not reservations.confirm(db, booking, now)
+    assert status(db, booking) == "CANCELLED"
+    assert capacity(db, flight) == 1000
+
+
+def test_confirmed_booking_is_not_expired(db, add_flight):
+    flight = add_flight(1000)
+    now = int(time.time())
+    booking = hold(db, flight, 300, now + 60)
+    with reservations.write_transaction(db):
+        assert reservations.confirm(db, booking, now)
+
+    assert hold_expiry.expire_holds(db, [booking], now + 120) == []
+    assert status(db, booking) == "CONFIRMED"
+    assert capacity(db, flight) == 700
+
+
+def test_worker_releases_scheduled_holds(db_path, db, add_flight):
+    flight = add_flight(1000)
+    now = int(time.time())
+    worker = hold_expiry.HoldExpiryWorker(db_path, sweep_interval=3600).start()
+    try:
+        booking = hold(db, flight, 300, now)
+        worker.schedule(booking, now)
+
+        deadline = time.time() + 5
+        while status(db, booking) == "HOLD" and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        worker.stop(timeout=5)
+
+    assert status(db, booking) == "CANCELLED"
+    assert capacity(db, flight) == 1000
+    assert worker.stats["expired"] == 1
+    assert worker.stats["max_delay"] <= MAX_DELAY
+
+
+def test_worker_releases_holds_at_volume(db_path, db, add_flight):
+    flights = [add_flight(10 * VOLUME, flight_no=f"EK{i}") for i in range(10)]
+    now = int(time.time())
+    holds = [(flights[i % len(flights)], 5, now + 1 + i % 2) for i in range(VOLUME)]
+    with reservations.write_transaction(db):
+        for flight_id, weight, _ in holds:
+            assert reservations.reserve(db, flight_id, weight)
+        db.executemany("""
+            INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight, status, expires_at)
+            VALUES (1, ?, ?, ?, 'HOLD', ?)
+        """, ((f, w, w, e) for f, w, e in holds))
+
+    # the worker loads the pending holds from the database when it starts
+    worker = hold_expiry.HoldExpiryWorker(db_path, sweep_interval=3600).start()
+    try:
+        deadline = now + 3 + MAX_DELAY + 10
+        while time.time() < deadline:
+            if not db.execute("SELECT COUNT(*) FROM bookings WHERE status='HOLD'").fetchone()[0]:
+                break
+            time.sleep(0.1)
+    finally:
+        worker.stop(timeout=5)
+
+    assert db.execute("SELECT COUNT(*) FROM bookings WHERE status='HOLD'").fetchone()[0] == 0
+    assert worker.stats["expired"] == VOLUME
+    assert worker.stats["batches"] >= VOLUME // hold_expiry.BATCH_SIZE
+    assert worker.stats["max_delay"] <= MAX_DELAY
+    assert all(capacity(db, f) == 10 * VOLUME for f in flights)
+    assert utilization.check(db) == []
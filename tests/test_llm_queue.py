@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import llm_queue
+import llm_slots
+
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.job(job_id)
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.01)
+    return queue.job(job_id)
+
+
+def test_queued_job_waits_for_a_slot(monkeypatch):
+    def backend(prompt):
+        with llm_slots.slot():
+            return prompt.upper()
+
+    monkeypatch.setitem(llm_queue.BACKENDS, "ollama", backend)
+    monkeypatch.setattr(llm_slots, "SLOT_WAIT", 0.05)
+    queue = llm_queue.LLMQueue(workers=1, maxsize=4).start()
+
+    # inline calls and streams hold every slot
+    semaphore = llm_slots.get_semaphore()
+    for _ in range(llm_slots.SLOTS):
+        assert semaphore.acquire(timeout=1)
+    try:
+        job_id = queue.submit("hello", owner=1)
+        time.sleep(0.3)   # well past SLOT_WAIT
+        assert queue.job(job_id)["status"] == "running"
+    finally:
+        for _ in range(llm_slots.SLOTS):
+            semaphore.release()
+
+    job = wait_for(queue, job_id)
+    assert job["status"] == "done" and job["result"] == "HELLO"
+
+
+def test_inline_call_gives_up_when_slots_are_busy(monkeypatch):
+    monkeypatch.setattr(llm_slots, "SLOT_WAIT", 0.05)
+    semaphore = llm_slots.get_semaphore()
+    for _ in range(llm_slots.SLOTS):
+        assert semaphore.acquire(timeout=1)
+    try:
+        with pytest.raises(llm_slots.Busy):
+            with llm_slots.slot():
+                pass
+    finally:
+        for _ in range(llm_slots.SLOTS):
+            semaphore.release()
@@ -0,0 +1,48 @@
+import threading
+
+import pubsub
+
+
+def test_unread_count_is_reread_after_ttl(monkeypatch):
+    broker = pubsub.Broker()
+    counts = iter([3, 7])
+    assert broker.unread_count(1, lambda: next(counts)) == 3
+
+    broker.add_unread(1, 1)
+    assert broker.unread_count(1, lambda: next(counts)) == 4
+
+    # another process added messages; the database has the real count
+    monkeypatch.setattr(pubsub, "UNREAD_TTL", 0)
+    assert broker.unread_count(1, lambda: next(counts)) == 7
+
+
+def test_add_unread_during_load_is_kept():
+    broker = pubsub.Broker()
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_load():
+        loading.set()
+        release.wait(5)
+        return 2
+
+    reader = threading.Thread(target=broker.unread_count, args=(1, slow_load))
+    reader.start()
+    loading.wait(5)
+    adder = threading.Thread(target=broker.add_unread, args=(1, 1))
+    adder.start()
+    release.set()
+    reader.join(5)
+    adder.join(5)
+
+    assert broker.unread_count(1, lambda: 0) == 3
+
+
+def test_add_unread_pushes_the_count():
+    broker = pubsub.Broker()
+    sub = broker.subscribe(["user:1"])
+    broker.unread_count(1, lambda: 0)
+    broker.add_unread(1, 2)
+    broker.add_unread(1, -5)
+
+    assert sub.queue.get_nowait() == ("unread", {"unread": 2})
+    assert sub.queue.get_nowait() == ("unread", {"unread": 0})
@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+
+import database
+import reservations
+import utilization
+
+THREADS = 8
+
+
+def book(db, flight_id, weight):
+    """The /book path: reserve and insert the HOLD in one write transaction."""
+    with reservations.write_transaction(db):
+        if not reservations.reserve(db, flight_id, weight):
+            return False
+        db.execute("""
+            INSERT INTO bookings (user_id, flight_id, weight, chargeable_weight, status, expires_at)
+            VALUES (1, ?, ?, ?, 'HOLD', 0)
+        """, (flight_id, weight, weight))
+    return True
+
+
+def test_reserve_refuses_more_than_capacity(db, add_flight):
+    flight = add_flight(100)
+    assert book(db, flight, 60)
+    assert not book(db, flight, 60)
+    assert book(db, flight, 40)
+    assert db.execute("SELECT capacity FROM flights WHERE id=?", (flight,)).fetchone()[0] == 0
+
+
+def test_no_oversell_under_concurrent_bookings(db_path, db, add_flight):
+    capacity, weight = 2000, 10
+    flight = add_flight(capacity)
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def worker():
+        conn = database.connect(db_path)
+        barrier.wait()
+        try:
+            # keep booking until the flight is sold out
+            while book(conn, flight, weight):
+                pass
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    booked, count = db.execute(
+        "SELECT COALESCE(SUM(weight), 0), COUNT(*) FROM bookings WHERE flight_id=?", (flight,)
+    ).fetchone()
+    left = db.execute("SELECT capacity FROM flights WHERE id=?", (flight,)).fetchone()[0]
+
+    assert errors == []
+    assert booked == capacity and count == capacity // weight
+    assert left == 0
+    assert utilization.check(db) == []
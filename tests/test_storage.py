@@ -0,0 +1,211 @@
+"""
+Repository, transactions and feed sync on both backends. The Postgres runs
+need psycopg and a scratch database, which the tests empty first:
+
+    CARGO_DB_URL=postgresql://localhost/cargo_test python -m pytest tests/test_storage.py
+"""
+import os
+import json
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import database
+import feed_sync
+import reservations
+import storage
+import utilization
+
+CARGO_DB_URL = os.environ.get("CARGO_DB_URL")
+
+TABLES = ("users", "flights", "bookings", "messages", "booking_messages",
+          "feed_state", "route_utilization")
+
+FLIGHT = ("Emirates", "EK1", "DXB", "LHR", "2025-12-10", 1000, "General",
+          "08:00", "12:00", 240)
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def conn(request, tmp_path):
+    if request.param == "sqlite":
+        path = str(tmp_path / "cargo.db")
+        database.init_db(path)
+        conn = database.connect(path)
+    else:
+        if not CARGO_DB_URL:
+            pytest.skip("set CARGO_DB_URL to run against Postgres")
+        pytest.importorskip("psycopg")
+        storage.init_postgres(CARGO_DB_URL)
+        conn = storage.PostgresPool(CARGO_DB_URL).connect()
+        conn.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def repo(conn):
+    backend = "postgres" if isinstance(conn, storage.PostgresConnection) else "sqlite"
+    return storage.REPOSITORIES[backend](conn)
+
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+# --------------------------
+# POSTGRES SHIM
+# --------------------------
+def test_translate_placeholders():
+    translate = storage.PostgresConnection.translate
+    assert translate("SELECT * FROM users WHERE id=? AND username LIKE 'a%'", (1,)) == \
+        "SELECT * FROM users WHERE id=%s AND username LIKE 'a%%'"
+    assert translate("SELECT COUNT(*) FROM users", ()) == "SELECT COUNT(*) FROM users"
+    assert translate("BEGIN IMMEDIATE", ()) == "BEGIN"
+
+
+# --------------------------
+# TRANSACTIONS
+# --------------------------
+def test_write_transaction_commits(conn):
+    with reservations.write_transaction(conn):
+        conn.execute("INSERT INTO messages(sender, text) VALUES(?, ?)", ("a", "hello"))
+    assert not conn.in_transaction
+    assert count(conn, "messages") == 1
+
+
+def test_write_transaction_rolls_back(conn):
+    with pytest.raises(RuntimeError):
+        with reservations.write_transaction(conn):
+            conn.execute("INSERT INTO messages(sender, text) VALUES(?, ?)", ("a", "hello"))
+            raise RuntimeError("boom")
+    assert not conn.in_transaction
+    assert count(conn, "messages") == 0
+
+
+# --------------------------
+# REPOSITORY
+# --------------------------
+def test_users(repo):
+    assert repo.create_user("ana", "secret", "forwarder")
+    assert not repo.create_user("ana", "other", "airline")
+
+    user = repo.user_by_username("ana")
+    repo.update_profile(user["id"], "ana@example.com", "123", "Acme")
+    assert repo.user(user["id"])["company"] == "Acme"
+
+
+def test_flights_and_holds(repo):
+    assert repo.upsert_flights([FLIGHT]) == 1
+    assert repo.upsert_flights([FLIGHT[:5] + (800,) + FLIGHT[6:]]) == 1   # same flight
+
+    [flight] = repo.find_flights("DXB", "LHR", "2025-12-10")
+    assert flight["capacity"] == 800
+
+    repo.create_user("ana", "secret", "forwarder")
+    user = repo.user_by_username("ana")
+    booking_id = repo.create_hold(user["id"], flight["id"], 500, 400, 500, 2.5, 1250, 0)
+    assert booking_id is not None
+    assert repo.create_hold(user["id"], flight["id"], 500, 400, 500, 2.5, 1250, 0) is None
+
+    assert repo.flight(flight["id"])["capacity"] == 300
+    assert repo.booking(booking_id)["status"] == "HOLD"
+    rows, cursor = repo.bookings(user)
+    assert [b["id"] for b in rows] == [booking_id] and cursor is None
+
+    assert repo.release_booking(booking_id, "HOLD", "CANCELLED")
+    assert not repo.release_booking(booking_id, "HOLD", "CANCELLED")
+    assert repo.flight(flight["id"])["capacity"] == 800
+    assert utilization.check(repo.db) == []
+
+
+# --------------------------
+# FEED SYNC
+# --------------------------
+class FeedHandler(BaseHTTPRequestHandler):
+    """An airline feed with an ETag, answering 304 when the client has it."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps(self.server.feeds[self.path]).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.server.seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def feeds():
+    """A local feed server; returns (server, url of /a, url of /b)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    server.daemon_threads = True
+    server.feeds, server.seen = {}, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    yield server, f"{base}/a", f"{base}/b"
+    server.shutdown()
+    server.server_close()
+
+
+def feed(flight_no, capacity=1000):
+    return [{"airline": "Emirates", "flight_no": flight_no, "origin": "dxb",
+             "destination": "lhr", "date": "2025-12-10", "capacity": capacity}]
+
+
+def test_sync_feeds(conn, feeds):
+    server, a, b = feeds
+    server.feeds.update({"/a": feed("EK1"), "/b": feed("EK2")})
+    report = feed_sync.sync_feeds(conn, [a, b], requests.Session())
+
+    assert {r["status"] for r in report.values()} == {"updated"}
+    assert count(conn, "flights") == 2
+    assert count(conn, "feed_state") == 2
+    assert utilization.check(conn) == []
+
+
+def test_unchanged_feed_is_skipped(conn, feeds):
+    server, a, b = feeds
+    server.feeds.update({"/a": feed("EK1"), "/b": feed("EK2")})
+    feed_sync.sync_feeds(conn, [a, b], requests.Session())
+    conn.execute("UPDATE feed_state SET synced_at = 0")
+    conn.commit()
+
+    server.feeds["/b"] = feed("EK2", capacity=500)
+    server.seen.clear()
+    report = feed_sync.sync_feeds(conn, [a, b], requests.Session())
+
+    # both requests carried the ETag from the first sync
+    assert len(server.seen) == 2 and all(etag for _, etag in server.seen)
+    assert report[a] == {"status": "not_modified", "rows": 0}
+    assert report[b] == {"status": "updated", "rows": 1}
+    synced = dict(conn.execute("SELECT url, synced_at FROM feed_state").fetchall())
+    assert synced[a] == 0 and synced[b] > 0
+    assert count(conn, "flights") == 2
+    assert conn.execute("SELECT capacity FROM flights WHERE flight_no='EK2'").fetchone()[0] == 500
+
+
+def test_failed_sync_writes_nothing(conn, feeds):
+    server, a, b = feeds
+    bad = feed("EK2")
+    del bad[0]["airline"]
+    server.feeds.update({"/a": feed("EK1"), "/b": bad})
+
+    with pytest.raises(KeyError):
+        feed_sync.sync_feeds(conn, [a, b], requests.Session())
+    assert not conn.in_transaction
+    assert count(conn, "flights") == 0
+    assert count(conn, "feed_state") == 0
+    assert count(conn, "route_utilization") == 0
@@ -0,0 +1,26 @@
+import reservations
+import utilization
+
+
+def test_bookings_do_not_change_the_flights_key(db, add_flight):
+    flight = add_flight(1000)
+    flights_key, data_key = utilization.flights_key(db), utilization.data_key(db)
+
+    with reservations.write_transaction(db):
+        assert reservations.reserve(db, flight, 300)
+
+    # the route map must refresh, the flight graph and airport index need not
+    assert utilization.flights_key(db) == flights_key
+    assert utilization.data_key(db) != data_key
+
+
+def test_new_and_deleted_flights_change_the_flights_key(db, add_flight):
+    first = add_flight(1000)
+    before = utilization.flights_key(db)
+    add_flight(500, flight_no="EK2")
+    added = utilization.flights_key(db)
+    assert added != before
+
+    db.execute("DELETE FROM flights WHERE id=?", (first,))
+    db.commit()
+    assert utilization.flights_key(db) not in (before, added)
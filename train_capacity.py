@@ -1,13 +1,33 @@
 # train_capacity.py
+#
+#   python train_capacity.py               # train, save model + prediction table
+#   python train_capacity.py --table-only  # rebuild the table for the saved model
 import os
+import sys
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from joblib import dump
+from joblib import dump, load
+
+from ai_ml import MODEL_PATH, TABLE_PATH, file_version, prediction_table
 
 os.makedirs("models", exist_ok=True)
 
+
+def save_table(model, columns):
+    """Precompute every prediction so ai_ml can serve them without sklearn."""
+    table = prediction_table(model, columns)
+    np.savez(TABLE_PATH, model_version=np.array(file_version(MODEL_PATH)), **table)
+    print(f"Saved: {TABLE_PATH} ({table['predictions'].size} predictions)")
+
+
+if sys.argv[1:] == ["--table-only"]:
+    md = load(MODEL_PATH)
+    save_table(md["model"], md["columns"])
+    sys.exit(0)
+
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
 # Try to load historical flight data (if user exported CSV). Otherwise synthesize demo data.
 if os.path.exists("historical_flights.csv"):
     df = pd.read_csv("historical_flights.csv")
@@ -41,5 +61,7 @@ print("Train R2:", model.score(X_train, y_train))
 print("Test R2:", model.score(X_test, y_test))
 
 # save model + example feature columns
-dump({"model": model, "columns": X.columns.tolist()}, "models/capacity_model.joblib")
-print("Saved: models/capacity_model.joblib")
+dump({"model": model, "columns": X.columns.tolist()}, MODEL_PATH)
+print("Saved:", MODEL_PATH)
+
+save_table(model, X.columns.tolist())
@@ -0,0 +1,172 @@
+# utilization.py
+# route_utilization: per route/date/cargo type totals of remaining capacity,
+# held weight and confirmed weight, kept current by the booking routes.
+#
+#   python utilization.py rebuild
+#   python utilization.py check
+
+import sys
+
+KEY = "origin, destination, date, cargo_type"
+
+# Aggregate straight from flights and bookings; {where} narrows it to
+# specific routes for partial refreshes.
+SUMMARY_SQL = """
+    SELECT COALESCE(f.origin, '') AS origin,
+           COALESCE(f.destination, '') AS destination,
+           COALESCE(f.date, '') AS date,
+           COALESCE(f.cargo_type, 'General') AS cargo_type,
+           COALESCE(SUM(f.capacity), 0) AS capacity,
+           COALESCE(SUM(b.held), 0) AS held,
+           COALESCE(SUM(b.confirmed), 0) AS confirmed
+    FROM flights f
+    LEFT JOIN (
+        SELECT flight_id,
+               SUM(CASE WHEN status='HOLD' THEN weight ELSE 0 END) AS held,
+               SUM(CASE WHEN status='CONFIRMED' THEN weight ELSE 0 END) AS confirmed
+        FROM bookings
+        GROUP BY flight_id
+    ) b ON b.flight_id = f.id
+    {where}
+    GROUP BY 1, 2, 3, 4
+"""
+
+INSERT_SQL = f"INSERT INTO route_utilization ({KEY}, capacity, held, confirmed) "
+
+# Past this many touched routes one full rebuild beats per-route refreshes.
+REBUILD_THRESHOLD = 2000
+
+
+def create_table(db):
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS route_utilization (
+            origin TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            date TEXT NOT NULL,
+            cargo_type TEXT NOT NULL,
+            capacity REAL DEFAULT 0,
+            held REAL DEFAULT 0,
+            confirmed REAL DEFAULT 0,
+            PRIMARY KEY ({KEY})
+        )
+    """)
+
+
+# --------------------------
+# INCREMENTAL UPDATES
+# --------------------------
+def apply(db, flight_id, capacity=0, held=0, confirmed=0):
+    """
+    Add deltas to the summary row of the flight's route/date/cargo type.
+    Call inside the same transaction as the booking change.
+    """
+    db.execute(f"""
+        {INSERT_SQL}
+        SELECT COALESCE(origin, ''), COALESCE(destination, ''), COALESCE(date, ''),
+               COALESCE(cargo_type, 'General'), ?, ?, ?
+        FROM flights WHERE id = ?
+        ON CONFLICT ({KEY}) DO UPDATE SET
+            capacity = route_utilization.capacity + excluded.capacity,
+            held = route_utilization.held + excluded.held,
+            confirmed = route_utilization.confirmed + excluded.confirmed
+    """, (capacity or 0, held or 0, confirmed or 0, flight_id))
+
+
+def refresh_routes(db, routes):
+    """Recompute the rows for (origin, destination, date) triples after flight uploads."""
+    routes = list(set(routes))
+    if len(routes) > REBUILD_THRESHOLD:
+        rebuild(db)
+        return
+    db.executemany(
+        "DELETE FROM route_utilization WHERE origin=? AND destination=? AND date=?",
+        routes
+    )
+    db.executemany(
+        INSERT_SQL + SUMMARY_SQL.format(where="WHERE f.origin=? AND f.destination=? AND f.date=?"),
+        routes
+    )
+
+
+def rebuild(db):
+    db.execute("DELETE FROM route_utilization")
+    db.execute(INSERT_SQL + SUMMARY_SQL.format(where=""))
+
+
+def check(db):
+    """
+    Compare the summary against a fresh aggregate. Returns a list of
+    (key, stored, expected) for every row that drifted.
+    """
+    fresh = {tuple(r[:4]): tuple(r[4:]) for r in db.execute(SUMMARY_SQL.format(where=""))}
+    stored = {
+        tuple(r[:4]): tuple(r[4:])
+        for r in db.execute(f"SELECT {KEY}, capacity, held, confirmed FROM route_utilization")
+    }
+
+    drift = []
+    for key in fresh.keys() | stored.keys():
+        have = stored.get(key, (0, 0, 0))
+        want = fresh.get(key, (0, 0, 0))
+        if any(abs((a or 0) - (b or 0)) > 0.01 for a, b in zip(have, want)):
+            drift.append((key, have, want))
+    return drift
+
+
+# --------------------------
+# DASHBOARD READ
+# --------------------------
+def flights_key(db):
+    """
+    Changes when flights are added or deleted, but not when a booking moves
+    capacity. The flight graph and airport index compare against it, so
+    booking traffic does not rebuild them; in-place flight upserts still
+    need their invalidate().
+    """
+    return tuple(db.execute("SELECT MAX(id), COUNT(*) FROM flights").fetchone())
+
+
+def data_key(db):
+    """
+    Changes whenever flights are added or a booking moves capacity
+    (route_utilization is updated in the same transaction). The route map,
+    which shows remaining capacity, compares against it.
+    """
+    max_id = db.execute("SELECT MAX(id) FROM flights").fetchone()[0]
+    totals = db.execute(
+        "SELECT COUNT(*), COALESCE(SUM(capacity), 0) FROM route_utilization"
+    ).fetchone()
+    return (max_id, tuple(totals))
+
+
+def route_totals(db):
+    return db.execute("""
+        SELECT origin, destination,
+               SUM(capacity) AS capacity,
+               SUM(held) AS held,
+               SUM(confirmed) AS used
+        FROM route_utilization
+        GROUP BY origin, destination
+        ORDER BY origin, destination
+    """).fetchall()
+
+
+if __name__ == "__main__":
+    import database
+
+    database.init_db()
+    conn = database.connect()
+    if sys.argv[1:] == ["rebuild"]:
+        rebuild(conn)
+        conn.commit()
+        print("route_utilization rebuilt")
+    elif sys.argv[1:] == ["check"]:
+        problems = check(conn)
+        for key, have, want in problems:
+            print(" / ".join(key), "stored", have, "expected", want)
+        print(f"{len(problems)} route rows out of date")
+        sys.exit(1 if problems else 0)
+    else:
+        print("usage: python utilization.py {rebuild|check}")
+        sys.exit(1)
+    conn.close()